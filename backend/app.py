@@ -16,6 +16,10 @@ if sys.platform == "win32":
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding="utf-8", errors="replace")
 from datetime import timedelta
 from dotenv import load_dotenv
+
+# Load .env once, before any project module reads configuration
+load_dotenv()
+
 from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
@@ -26,8 +30,6 @@ from routes.api.chat_routes import chat_bp
 # IMPORT PRE-INITIALIZATION (relative import)
 from utils.start_up import initialize_rag_components
 
-load_dotenv()
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
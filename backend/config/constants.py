@@ -3,6 +3,8 @@ Configuration constants for VieMedChat backend
 Centralized location for all magic numbers and configuration values
 """
 
+import os
+
 
 # ==========================================
 # RAG Configuration
@@ -22,6 +24,8 @@ class RAGConfig:
     # Reranker settings
     RERANK_THRESHOLD = 0.3  # Minimum score to keep document after reranking
     RERANK_TOP_N = 5  # Number of top documents after reranking
+    RERANKER_BACKEND = "auto"  # "auto" (INT8 ONNX on CPU-only hosts), "torch" or "onnx"
+    RERANK_SKIP_VECTOR_SCORE = 0.88  # Top-1 vector similarity above which reranking is skipped
 
     # Model names
     DEFAULT_EMBEDDING_MODEL = "BAAI/bge-m3"
@@ -44,6 +48,27 @@ class ChatConfig:
     MAX_OUTPUT_TOKENS = 4096
 
 
+# ==========================================
+# Cache Configuration
+# ==========================================
+class CacheConfig:
+    """Configuration for response caching"""
+
+    # Semantic cache (near-duplicate queries)
+    SEMANTIC_CACHE_THRESHOLD = 0.92  # Minimum cosine similarity for a hit
+    SEMANTIC_CACHE_SIZE = 512  # Maximum number of cached queries
+    SEMANTIC_CACHE_TTL = 3600  # Seconds; matches the search result cache
+
+    # Exact-match LLM answer cache (in-memory LRU + SQLite)
+    LLM_CACHE_PATH = "cache/llm_cache.db"
+    LLM_SEMANTIC_CACHE_SIZE = 1024  # Paraphrase layer in front of the RAG LLM
+
+    # Retrieval cache: paraphrased queries reuse the retrieved + reranked context
+    RETRIEVAL_CACHE_THRESHOLD = float(os.getenv("RETRIEVAL_CACHE_THRESHOLD", "0.92"))
+    RETRIEVAL_CACHE_SIZE = int(os.getenv("RETRIEVAL_CACHE_SIZE", "512"))
+    RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", "3600"))  # Seconds
+
+
 # ==========================================
 # Database Configuration
 # ==========================================
@@ -1,9 +1,10 @@
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 from config.database import get_db_connection, release_db_connection
 from config.constants import ChatConfig
-from utils.rag_service import call_rag_gemini
+from utils.rag_service import call_rag_gemini, stream_rag_gemini
 import traceback
 import logging
+import json
 
 logger = logging.getLogger(__name__)
 
@@ -245,6 +246,157 @@ def send_message(user_id):
         return jsonify({"message": "Lỗi khi gửi tin nhắn.", "error": str(e)}), 500
 
 
+def _sse(data, event=None):
+    """Format one Server-Sent Events frame"""
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _message_to_dict(row):
+    """Convert a messages row to the camelCase-compatible dict the frontend expects"""
+    return {
+        "id": row[0],
+        "conversation_id": row[1],
+        "sender": row[2],
+        "content": row[3],
+        "timestamp": row[4].isoformat(),
+    }
+
+
+def send_message_stream(user_id):
+    """
+    Send a message and stream the AI response as Server-Sent Events
+
+    Frames:
+    - data: {"section": str}                         one per completed answer section
+    - event: done / data: {userMessage, botMessage}  after the bot message is saved
+    - event: error / data: {message}                 if saving fails
+    """
+    logger.info(f"Streaming message from user {user_id}")
+
+    conn = None
+    cursor = None
+
+    try:
+        data = request.get_json()
+
+        conversation_id = data.get("conversationId")
+        content = data.get("content")
+
+        if not conversation_id or not content:
+            return jsonify({"message": "Thiếu thông tin."}), 400
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        # Insert user message
+        cursor.execute(
+            """
+            INSERT INTO messages (conversation_id, sender, content)
+            VALUES (%s, %s, %s)
+            RETURNING id, conversation_id, sender, content, timestamp
+            """,
+            (conversation_id, "user", content),
+        )
+        user_message = cursor.fetchone()
+        conn.commit()
+
+        # Fetch conversation history
+        cursor.execute(
+            """
+            SELECT sender, content
+            FROM messages
+            WHERE conversation_id = %s
+            ORDER BY timestamp DESC
+            LIMIT %s
+            """,
+            (conversation_id, ChatConfig.CHAT_HISTORY_LIMIT),
+        )
+        history = cursor.fetchall()
+        history.reverse()
+
+        cursor.close()
+        release_db_connection(conn)
+        cursor = None
+        conn = None
+
+        messages = [
+            {"role": "user" if msg[0] == "user" else "assistant", "content": msg[1]}
+            for msg in history
+        ]
+
+    except Exception as e:
+        logger.error(f"Error preparing streamed message: {e}")
+        traceback.print_exc()
+
+        if conn:
+            conn.rollback()
+        if cursor:
+            cursor.close()
+        if conn:
+            release_db_connection(conn)
+
+        return jsonify({"message": "Lỗi khi gửi tin nhắn.", "error": str(e)}), 500
+
+    def generate():
+        sections = []
+        for section in stream_rag_gemini(messages):
+            sections.append(section)
+            yield _sse({"section": section})
+
+        # Save the full answer once streaming is complete
+        save_conn = None
+        save_cursor = None
+        try:
+            save_conn = get_db_connection()
+            save_cursor = save_conn.cursor()
+            save_cursor.execute(
+                """
+                INSERT INTO messages (conversation_id, sender, content)
+                VALUES (%s, %s, %s)
+                RETURNING id, conversation_id, sender, content, timestamp
+                """,
+                (conversation_id, "bot", "\n\n".join(sections)),
+            )
+            bot_message = save_cursor.fetchone()
+            save_cursor.execute(
+                """
+                UPDATE conversations
+                SET updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+                """,
+                (conversation_id,),
+            )
+            save_conn.commit()
+
+            yield _sse(
+                {
+                    "userMessage": _message_to_dict(user_message),
+                    "botMessage": _message_to_dict(bot_message),
+                },
+                event="done",
+            )
+
+        except Exception as e:
+            logger.error(f"Error saving streamed message: {e}")
+            traceback.print_exc()
+            if save_conn:
+                save_conn.rollback()
+            yield _sse({"message": "Lỗi khi lưu tin nhắn."}, event="error")
+
+        finally:
+            if save_cursor:
+                save_cursor.close()
+            if save_conn:
+                release_db_connection(save_conn)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 def get_messages(user_id, conversation_id):
     """Get all messages in a conversation"""
     logger.info(f"Getting messages for conversation {conversation_id}")
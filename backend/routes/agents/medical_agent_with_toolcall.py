@@ -5,17 +5,78 @@ More efficient than ReAct - saves 50-70% API quota!
 """
 
 import os
-from dotenv import load_dotenv
+import re
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
-import sys
+from routes.agents.tools.medical_search_tool import get_medical_tools, SEARCH_FAILURE_REPLIES
+from routes.agents.tools.general_chat_tool import general_chat_stream
+from utils.rag_service import get_rag_service
+from utils.semantic_cache import SemanticCache
+from utils.section_stream import iter_sections
+from config.constants import CacheConfig
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
+# Tools whose answers are safe to reuse for paraphrased queries
+# (calculator is excluded: "2 + 2" and "2 + 3" embed almost identically)
+CACHEABLE_TOOLS = {"search_medical_documents", "general_chat"}
 
-from routes.agents.tools.medical_search_tool import get_medical_tools
 
-load_dotenv()
+# ==========================================
+# Regex Pre-Router
+# ==========================================
+# Obvious intents are routed here and the tool is forced via tool_choice,
+# so the model does not need long routing instructions in the system prompt.
+# Order matters: first match wins; no match -> let the model choose ("auto").
+# Medical terms are checked before greetings, so "chào bác sĩ, tôi bị sốt"
+# is searched rather than answered as small talk. Greetings are anchored:
+# only a greeting plus filler words / address terms counts.
+_GREETING_TAIL = (
+    r"(?:[\s,]+(?:bạn|ban|nhé|nhe|nha|ạ|nhiều|nhieu|lắm|lam|you|so much|very much"
+    r"|bác sĩ|bác sỹ|bac si|em|anh|chị|chi|bot|mọi người|moi nguoi))*"
+)
+_ROUTES = [
+    (
+        "search_medical_documents",
+        re.compile(
+            r"triệu chứng|bệnh(?! viện)|thuốc|điều trị|\bđau\b|\bsốt\b|\bho\b"
+            r"|viêm|tiểu đường|huyết áp",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        "general_chat",
+        re.compile(
+            r"^\s*(?:xin chào|chào|hello|hi|hey|cảm ơn|cám ơn|thanks?|thank you"
+            r"|tạm biệt|bye|goodbye)" + _GREETING_TAIL + r"\s*[!.?]*\s*$",
+            re.IGNORECASE,
+        ),
+    ),
+    ("calculator", re.compile(r"\d\s*[\+\*/]\s*\d|\d\s+-\s+\d")),
+]
+
+
+def route_query(query: str):
+    """
+    Predict the tool for a query when the intent is unambiguous
+
+    Args:
+        query: User question
+
+    Returns:
+        str | None: Tool name, or None to let the LLM decide
+
+    Examples:
+        >>> route_query("chào bác sĩ")
+        'general_chat'
+        >>> route_query("hi tôi bị ho")
+        'search_medical_documents'
+        >>> route_query("chào bác sĩ tôi bị sốt")
+        'search_medical_documents'
+    """
+    for tool_name, pattern in _ROUTES:
+        if pattern.search(query):
+            return tool_name
+    return None
 
 
 class MedicalAgentToolCalling:
@@ -55,56 +116,175 @@ class MedicalAgentToolCalling:
         # Create tool map for execution
         self.tool_map = {tool.name: tool.func for tool in self.tools}
 
-        # Bind tools to LLM
+        # Bind tools to LLM (model chooses)
         self.llm_with_tools = self.llm.bind_tools(self.tools)
 
-        # System prompt - natural and flexible
-        self.system_prompt = """Bạn là VieMedChat - trợ lý y tế AI thân thiện, chuyên nghiệp.
+        # Pre-bound variants that force a specific tool (used by the pre-router)
+        self.llm_forced = {
+            tool.name: self.llm.bind_tools(self.tools, tool_choice=tool.name)
+            for tool in self.tools
+        }
+
+        # Semantic cache - paraphrased queries skip the whole LLM + tool pipeline
+        self.semantic_cache = SemanticCache(
+            embed_fn=self._embed_query,
+            threshold=CacheConfig.SEMANTIC_CACHE_THRESHOLD,
+            maxsize=CacheConfig.SEMANTIC_CACHE_SIZE,
+            ttl=CacheConfig.SEMANTIC_CACHE_TTL,
+        )
 
-🎯 NHIỆM VỤ:
-Phân tích câu hỏi và LUÔN gọi một trong các công cụ bên dưới.
+        # System prompt - short on purpose (billed on every call);
+        # routing rules already live in the tool descriptions
+        self.system_prompt = """Bạn là VieMedChat - trợ lý y tế AI thân thiện, chuyên nghiệp.
+LUÔN gọi một công cụ phù hợp trước khi trả lời; nếu không chắc, gọi general_chat.
 
-🛠️ CÁC CÔNG CỤ:
-1. **search_medical_documents** - Tìm thông tin y tế (triệu chứng, bệnh, thuốc, điều trị)
-2. **calculator** - Tính toán (BMI, công thức)
-3. **general_chat** - Trò chuyện thông thường
+Khi trả lời dựa trên kết quả công cụ:
+- Tự nhiên, thân thiện, có emoji phù hợp 😊, KHÔNG dùng format cứng nhắc
+- Tổng hợp thông tin mạch lạc, đưa lời khuyên thực tế
+- Luôn nhắc đi khám bác sĩ nếu nghiêm trọng
+- Trả lời bằng TIẾNG VIỆT CÓ DẤU"""
 
-📋 CÁCH PHÂN LOẠI:
+        print(f"Tool Calling Agent initialized (Direct binding)")
+        print(f"   Model: {self.model_name}")
+        print(f"   Tools: {len(self.tools)}")
 
-A. Gọi search_medical_documents khi hỏi về:
-   - Triệu chứng: đau đầu, sốt, ho, đau bụng
-   - Bệnh: tiểu đường, cao huyết áp
-   - Thuốc, cách điều trị, phòng ngừa
+    @staticmethod
+    def _embed_query(text: str):
+        """Embed query with the already-loaded RAG embedding model (bge-m3)"""
+        # Shares the query-embedding cache with retrieval, so the search
+        # for the same query does not embed it again
+        return get_rag_service().vectorstore.embed_query(text)
+
+    def _build_messages(self, query: str, chat_history: list = None) -> list:
+        """Build system + history + current query messages"""
+        messages = [SystemMessage(content=self.system_prompt)]
+
+        # Add chat history if available
+        if chat_history:
+            for msg in chat_history[-10:]:  # Limit to last 10 messages to save context
+                role = msg.get("role")
+                content = msg.get("content")
+                if role == "user":
+                    messages.append(HumanMessage(content=content))
+                elif role == "assistant" or role == "bot":
+                    messages.append(AIMessage(content=content))
+
+        # Add current query
+        messages.append(HumanMessage(content=query))
+        return messages
+
+    def _run_tools(self, query: str, messages: list):
+        """
+        First LLM call (tool selection) + tool execution
 
-B. Gọi calculator khi có phép tính, công thức
+        Appends tool results to `messages` so the caller can make the
+        final-answer call (blocking or streaming).
 
-C. Gọi general_chat khi:
-   - Chào hỏi, cảm ơn, tạm biệt
-   - Câu hỏi không liên quan y tế
+        Returns:
+            tuple: (tool_calls_made, error_answer or None)
+        """
+        # First call - force the tool when the pre-router is confident,
+        # otherwise the LLM decides which tool to use
+        predicted_tool = route_query(query)
+        if predicted_tool in self.llm_forced:
+            print(f"Pre-router: forcing {predicted_tool}")
+            response = self.llm_forced[predicted_tool].invoke(messages)
+        else:
+            response = self.llm_with_tools.invoke(messages)
 
-💬 CÁCH TRẢ LỜI (SAU KHI CÓ KẾT QUẢ TỪ TOOL):
+        tool_calls_made = []
+        error_answer = None
+
+        # Check if LLM wants to use tools
+        tool_calls = []
+        if hasattr(response, "tool_calls") and response.tool_calls:
+            tool_calls = response.tool_calls
+            print(f"LLM requested {len(tool_calls)} tool call(s)")
+        else:
+            # FORCE general_chat if no tool is called
+            print("LLM did not call any tool. Forcing general_chat...")
+            tool_calls = [{"name": "general_chat", "args": {"query": query}}]
+
+        # Execute each tool call
+        for tool_call in tool_calls:
+            tool_name = tool_call.get("name")
+            tool_args = tool_call.get("args", {})
+
+            print(f"   -> Calling {tool_name} with args: {tool_args}")
+
+            if tool_name in self.tool_map:
+                # Execute tool - handle both named args and positional args
+                try:
+                    # Try with original args first
+                    tool_result = self.tool_map[tool_name](**tool_args)
+                except TypeError as e:
+                    # If that fails, try extracting positional args (__arg1, __arg2, etc.)
+                    if "__arg1" in tool_args:
+                        positional_args = []
+                        i = 1
+                        while f"__arg{i}" in tool_args:
+                            positional_args.append(tool_args[f"__arg{i}"])
+                            i += 1
+                        tool_result = self.tool_map[tool_name](*positional_args)
+                    else:
+                        raise e
+
+                tool_calls_made.append(
+                    {
+                        "tool": tool_name,
+                        "input": str(tool_args),
+                        "output": str(tool_result)[:100],
+                    }
+                )
+
+                # Add tool result to messages for the final answer
+                messages.append(response)
+                messages.append(
+                    HumanMessage(
+                        content=f"Tool result: {tool_result}\n\nBased on this, please provide your final answer to the user."
+                    )
+                )
+            else:
+                error_answer = f"Loi: Tool '{tool_name}' khong ton tai."
 
-Trả lời tự nhiên, thân thiện như đang trò chuyện với bạn bè. KHÔNG dùng format cứng nhắc như "Bước 1", "Bước 2".
+        if tool_calls_made:
+            error_answer = None
+        return tool_calls_made, error_answer
 
-Ví dụ cách trả lời tốt:
-"Chào bạn! Về tình trạng đau bụng của bạn, có thể do nhiều nguyên nhân như... Bạn có thể thử chườm nóng để giảm đau. Nếu đau nhiều hoặc kéo dài, nên đi khám bác sĩ nhé!"
+    def _cache_lookup(self, query: str, chat_history: list = None):
+        """
+        Semantic cache lookup - only for standalone queries, since answers
+        to follow-up questions depend on the conversation history
 
-Nguyên tắc:
-- Thân thiện, gần gũi, có emoji phù hợp 😊
-- Dùng ngôn ngữ tự nhiên, dễ hiểu
-- Tổng hợp thông tin từ tool một cách mạch lạc
-- Đưa ra lời khuyên thực tế
-- Luôn nhắc đi khám bác sĩ nếu nghiêm trọng
-- KHÔNG liệt kê theo format cứng nhắc
-- Trả lời bằng TIẾNG VIỆT CÓ DẤU
+        Returns:
+            tuple: (cache_vec or None, cached result or None)
+        """
+        if chat_history:
+            return None, None
+        try:
+            cache_vec = self.semantic_cache.encode(query)
+            return cache_vec, self.semantic_cache.lookup(cache_vec)
+        except Exception as e:
+            print(f"Semantic cache unavailable: {e}")
+            return None, None
 
-⚠️ QUY TẮC BẮT BUỘC:
-- PHẢI gọi tool trước khi trả lời
-- Nếu không chắc loại câu hỏi → gọi general_chat"""
+    def _cache_store(self, cache_vec, result: dict):
+        """
+        Cache successful tool-backed answers for paraphrased repeats
 
-        print(f"Tool Calling Agent initialized (Direct binding)")
-        print(f"   Model: {self.model_name}")
-        print(f"   Tools: {len(self.tools)}")
+        Answers built on a failed or empty search are not cached, so a brief
+        Pinecone outage is not replayed to every paraphrase.
+        """
+        if (
+            cache_vec is not None
+            and result["tool_calls"]
+            and all(
+                c["tool"] in CACHEABLE_TOOLS
+                and not c["output"].startswith(SEARCH_FAILURE_REPLIES)
+                for c in result["tool_calls"]
+            )
+        ):
+            self.semantic_cache.add(cache_vec, result)
 
     def chat(self, query: str, chat_history: list = None) -> dict:
         """
@@ -127,95 +307,32 @@ Nguyên tắc:
             print(f"{'='*60}")
             print(f"Query: {query[:50]}...")
 
-            # Prepare messages
-            messages = [SystemMessage(content=self.system_prompt)]
-
-            # Add chat history if available
-            if chat_history:
-                for msg in chat_history[
-                    -10:
-                ]:  # Limit to last 10 messages to save context
-                    role = msg.get("role")
-                    content = msg.get("content")
-                    if role == "user":
-                        messages.append(HumanMessage(content=content))
-                    elif role == "assistant" or role == "bot":
-                        messages.append(AIMessage(content=content))
-
-            # Add current query
-            messages.append(HumanMessage(content=query))
-
-            # First call - LLM decides which tool to use
-            response = self.llm_with_tools.invoke(messages)
+            cache_vec, cached = self._cache_lookup(query, chat_history)
+            if cached is not None:
+                print("Semantic cache HIT - skipping agent")
+                return {**cached, "api_calls": 0}
 
-            tool_calls_made = []
+            messages = self._build_messages(query, chat_history)
+            tool_calls_made, error_answer = self._run_tools(query, messages)
 
-            # Check if LLM wants to use tools
-            tool_calls = []
-            if hasattr(response, "tool_calls") and response.tool_calls:
-                tool_calls = response.tool_calls
-                print(f"LLM requested {len(tool_calls)} tool call(s)")
+            # Second call - LLM generates final answer
+            if error_answer:
+                answer = error_answer
             else:
-                # FORCE general_chat if no tool is called
-                print("LLM did not call any tool. Forcing general_chat...")
-                tool_calls = [{"name": "general_chat", "args": {"query": query}}]
-
-            # Execute each tool call
-            for tool_call in tool_calls:
-                tool_name = tool_call.get("name")
-                tool_args = tool_call.get("args", {})
-
-                print(f"   -> Calling {tool_name} with args: {tool_args}")
-
-                if tool_name in self.tool_map:
-                    # Execute tool - handle both named args and positional args
-                    try:
-                        # Try with original args first
-                        tool_result = self.tool_map[tool_name](**tool_args)
-                    except TypeError as e:
-                        # If that fails, try extracting positional args (__arg1, __arg2, etc.)
-                        if "__arg1" in tool_args:
-                            positional_args = []
-                            i = 1
-                            while f"__arg{i}" in tool_args:
-                                positional_args.append(tool_args[f"__arg{i}"])
-                                i += 1
-                            tool_result = self.tool_map[tool_name](*positional_args)
-                        else:
-                            raise e
-
-                    tool_calls_made.append(
-                        {
-                            "tool": tool_name,
-                            "input": str(tool_args),
-                            "output": str(tool_result)[:100],
-                        }
-                    )
-
-                    # Add tool result to messages and get final answer
-                    messages.append(response)
-                    messages.append(
-                        HumanMessage(
-                            content=f"Tool result: {tool_result}\n\nBased on this, please provide your final answer to the user."
-                        )
-                    )
-
-                    # Second call - LLM generates final answer
-                    final_response = self.llm.invoke(messages)
-                    answer = final_response.content
-                else:
-                    answer = f"Loi: Tool '{tool_name}' khong ton tai."
+                answer = self.llm.invoke(messages).content
 
             print(f"\nCOMPLETED")
             print(f"   Tools used: {len(tool_calls_made)}")
             print(f"{'='*60}\n")
 
-            return {
+            result = {
                 "answer": answer,
                 "used_tools": len(tool_calls_made) > 0,
                 "tool_calls": tool_calls_made,
                 "api_calls": len(tool_calls_made) + 1,
             }
+            self._cache_store(cache_vec, result)
+            return result
 
         except Exception as e:
             print(f"Error in agent: {e}")
@@ -230,6 +347,66 @@ Nguyên tắc:
                 "api_calls": 0,
             }
 
+    def chat_stream(self, query: str, chat_history: list = None):
+        """
+        Chat with agent, streaming the final answer section by section
+
+        Tool selection/execution is unchanged; only the final-answer call is
+        streamed and grouped into completed Markdown sections.
+
+        Args:
+            query: User question
+            chat_history: Previous conversation
+
+        Yields:
+            str: Completed answer sections
+        """
+        try:
+            print(f"\nTOOL CALLING AGENT (Stream) - Query: {query[:50]}...")
+
+            # Obvious small talk - stream general_chat straight from Gemini,
+            # skipping the tool-selection and final-answer LLM calls
+            if route_query(query) == "general_chat":
+                print("Pre-router: streaming general_chat directly")
+                yield from iter_sections(general_chat_stream(query))
+                return
+
+            cache_vec, cached = self._cache_lookup(query, chat_history)
+            if cached is not None:
+                print("Semantic cache HIT - skipping agent")
+                yield from iter_sections([cached["answer"]])
+                return
+
+            messages = self._build_messages(query, chat_history)
+            tool_calls_made, error_answer = self._run_tools(query, messages)
+
+            if error_answer:
+                yield error_answer
+                return
+
+            sections = []
+            token_stream = (chunk.content for chunk in self.llm.stream(messages))
+            for section in iter_sections(token_stream):
+                sections.append(section)
+                yield section
+
+            self._cache_store(
+                cache_vec,
+                {
+                    "answer": "\n\n".join(sections),
+                    "used_tools": len(tool_calls_made) > 0,
+                    "tool_calls": tool_calls_made,
+                    "api_calls": len(tool_calls_made) + 1,
+                },
+            )
+
+        except Exception as e:
+            print(f"Error in agent stream: {e}")
+            import traceback
+
+            traceback.print_exc()
+            yield "Xin loi, toi dang gap su co ky thuat. Vui long thu lai sau."
+
 
 # ==========================================
 # Singleton Instance
@@ -283,3 +460,26 @@ def chat_with_agent(messages: list) -> str:
 
         traceback.print_exc()
         return "Xin loi, toi dang gap su co ky thuat. Vui long thu lai sau."
+
+
+def stream_with_agent(messages: list):
+    """
+    Streaming wrapper for Flask chat_controller
+
+    Args:
+        messages: Conversation history
+
+    Yields:
+        str: Completed answer sections
+    """
+    try:
+        agent = get_medical_agent_tool_calling(model_name="models/gemini-2.5-flash")
+        last_message = messages[-1]["content"] if messages else ""
+        yield from agent.chat_stream(query=last_message, chat_history=messages[:-1])
+
+    except Exception as e:
+        print(f"Error in stream_with_agent: {e}")
+        import traceback
+
+        traceback.print_exc()
+        yield "Xin loi, toi dang gap su co ky thuat. Vui long thu lai sau."
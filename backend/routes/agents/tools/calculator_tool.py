@@ -7,6 +7,9 @@ from langchain.tools import Tool
 from pydantic import BaseModel, Field
 from typing import Optional
 import re
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 # ==========================================
@@ -47,8 +50,7 @@ def calculate(expression: str) -> str:
         str: Calculation result or error message
     """
     try:
-        print(f"\n🧮 CALCULATOR TOOL CALLED")
-        print(f"   Expression: {expression}")
+        logger.debug("calculator called expression=%s", expression)
 
         # Clean expression (remove spaces, validate characters)
         expression = expression.strip()
@@ -60,7 +62,7 @@ def calculate(expression: str) -> str:
         # Evaluate safely
         result = eval(expression, {"__builtins__": {}})
 
-        print(f"   ✅ Result: {result}")
+        logger.debug("calculator result=%s", result)
 
         # Format result nicely
         if isinstance(result, float) and result.is_integer():
@@ -77,7 +79,7 @@ def calculate(expression: str) -> str:
         )
 
     except Exception as e:
-        print(f"   ❌ Calculator error: {e}")
+        logger.warning("calculator error: %s", e)
         return f"❌ Lỗi khi tính toán: {str(e)}"
 
 
@@ -6,11 +6,306 @@ Handles casual conversation using LLM with professional personality
 from langchain.tools import Tool
 from pydantic import BaseModel, Field
 from typing import Optional
-import os
-import sys
+import re
+import asyncio
+import time
+import unicodedata
+import cachetools
+import datetime
+import threading
+import logging
 
-# Add backend to path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
+# Same top-level package path the app uses (backend/ is the working directory)
+from routes.rag.llms import LLM, TRUNCATION_EXTEND_FACTOR, ERROR_REPLY_PREFIX, _chunk_text
+from routes.rag.utils import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+# ==========================================
+# Cached LLM Client
+# ==========================================
+# LLM construction configures the Gemini client; pay that once per process
+# instead of on every general_chat call
+_CHAT_LLM_CONFIG = ("models/gemini-2.5-flash", 0.3, "vi")  # (model_name, temperature, language)
+# Replies are 1-3 sentences; output length dominates generation latency,
+# so cap it (truncated replies are regenerated once with a larger cap)
+_CHAT_MAX_OUTPUT_TOKENS = 80
+_CHAT_GENERATION_CONFIG = {"top_p": 0.9, "candidate_count": 1}
+_LLM_CACHE = {}
+_LLM_LOCK = threading.Lock()
+
+
+def _get_chat_llm():
+    """Get or create the shared chat LLM (thread-safe, double-checked)"""
+    llm = _LLM_CACHE.get(_CHAT_LLM_CONFIG)
+    if llm is None:
+        with _LLM_LOCK:
+            llm = _LLM_CACHE.get(_CHAT_LLM_CONFIG)
+            if llm is None:
+                model_name, temperature, language = _CHAT_LLM_CONFIG
+                llm = LLM(
+                    model_name=model_name,
+                    temperature=temperature,
+                    language=language,
+                    max_output_tokens=_CHAT_MAX_OUTPUT_TOKENS,
+                    generation_config=_CHAT_GENERATION_CONFIG,
+                )
+                _LLM_CACHE[_CHAT_LLM_CONFIG] = llm
+    return llm
+
+
+# ==========================================
+# Prompt Templates
+# ==========================================
+# Persona and notes are shared; rule blocks are selected per intent so common
+# queries send only what they need. SYSTEM_TEMPLATE (all blocks) is used for
+# unknown intents and registered with Gemini context caching.
+PERSONA = """Ban la VieMedChat - tro ly AI y te than thien va chuyen nghiep.
+
+TINH CACH:
+- Than thien, nhiet tinh, luon san sang giup do
+- Chuyen nghiep nhung khong cung nhac
+- Biet lang nghe va thau hieu
+- Tra loi ngan gon, tu nhien (1-3 cau)
+
+VAI TRO:
+Ban la tro ly AI chuyen ve y te, co the:
+- Tu van ve trieu chung, benh ly, thuoc men
+- Tinh toan cac chi so suc khoe (BMI, v.v.)
+- Tro chuyen than thien ve cac chu de thuong ngay"""
+
+DATA_SOURCE_NOTE = """NGUON DU LIEU:
+- Du lieu y te duoc thu thap tu Benh vien Da khoa Tam Anh
+- Co so du lieu chuyen sau ve cac benh ly, trieu chung, va dieu tri"""
+
+RULE_BLOCKS = {
+    "greeting": """Neu chao hoi (xin chao, hi, hello):
+   Tra loi: "Xin chao! Toi la VieMedChat, tro ly AI y te. Toi co the giup gi cho ban hom nay?\"""",
+    "whoami": """Neu hoi ve ban than (ban la ai, ten gi, lam gi):
+   Tra loi: "Toi la VieMedChat, tro ly AI chuyen ve y te. Toi co the giup ban tu van ve suc khoe, trieu chung benh, thuoc men, va cac van de y te khac!\"""",
+    "capabilities": """Neu hoi ve kha nang/tool (ban co the lam gi, co nhung tool nao):
+   Tra loi: "Toi co 3 cong cu chinh:
+   - Tim kiem thong tin y te (trieu chung, benh, thuoc)
+   - Tinh toan chi so suc khoe (BMI, v.v.)
+   - Tro chuyen tu van than thien
+   Ban can toi giup gi nhe?\"""",
+    "data_source": """Neu hoi ve nguon du lieu (du lieu tu dau, thu thap o dau):
+   Tra loi: "Du lieu y te cua toi duoc thu thap tu Benh vien Da khoa Tam Anh, mot trong nhung benh vien uy tin hang dau Viet Nam. Toi co the giup ban tim hieu ve cac van de suc khoe dua tren nguon thong tin nay!\"""",
+    "thanks": """Neu cam on (cam on, thanks):
+   Tra loi: "Rat vui duoc giup do ban! Neu co thac mac gi ve suc khoe, dung ngai hoi nhe!\"""",
+    "bye": """Neu tam biet (bye, tam biet):
+   Tra loi: "Tam biet! Chuc ban luon khoe manh! Hen gap lai!\"""",
+    "weather": """Neu hoi thoi tiet:
+   Tra loi: "Toi khong co kha nang xem thoi tiet, nhung toi co the tu van ve suc khoe cho ban! Ban co cau hoi gi ve y te khong?\"""",
+    "lifestyle": """Neu hoi mon an/du lich/giai tri:
+   Tra loi: "Do la chu de thu vi! Tuy nhien, toi chuyen ve y te hon. Nhung neu ban can tu van dinh duong hoac che do an uong cho suc khoe, toi rat san long giup do!\"""",
+    "general": """Neu tro chuyen chung chung:
+   Tra loi than thien, tu nhien, nhung nhe nhang dan dat ve chu de y te""",
+}
+
+NOTES = """LUU Y QUAN TRONG:
+- Tra loi NGAN GON (1-3 cau)
+- Tu nhien, khong rap khuon
+- Luon the hien su than thien
+- Nhe nhang nhac ve vai tro tro ly y te
+- KHONG nhac den Google, mo hinh ngon ngu, hay cong nghe AI
+- Chi noi ve nguon du lieu tu Benh vien Tam Anh khi duoc hoi"""
+
+
+def _rules_section(intents):
+    blocks = "\n\n".join(
+        f"{i}. {RULE_BLOCKS[intent]}" for i, intent in enumerate(intents, 1)
+    )
+    return f"HUONG DAN TRA LOI:\n\n{blocks}"
+
+
+SYSTEM_TEMPLATE = "\n\n".join(
+    [PERSONA, DATA_SOURCE_NOTE, _rules_section(list(RULE_BLOCKS)), NOTES]
+)
+
+USER_TURN_TEMPLATE = """NGUOI DUNG NOI: "{query}"
+Hay tra loi:"""
+
+
+# ==========================================
+# Intent Fast Path
+# ==========================================
+# Trivial utterances get their canonical reply without a Gemini round-trip.
+# Patterns are anchored to the whole message so "chao bac si, toi bi sot"
+# is NOT answered with a greeting; only true misses go to the LLM.
+GREETING_REPLY = "Xin chao! Toi la VieMedChat, tro ly AI y te. Toi co the giup gi cho ban hom nay?"
+THANKS_REPLY = "Rat vui duoc giup do ban! Neu co thac mac gi ve suc khoe, dung ngai hoi nhe!"
+BYE_REPLY = "Tam biet! Chuc ban luon khoe manh! Hen gap lai!"
+WHOAMI_REPLY = "Toi la VieMedChat, tro ly AI chuyen ve y te. Toi co the giup ban tu van ve suc khoe, trieu chung benh, thuoc men, va cac van de y te khac!"
+
+_FILLER = r"(?:\s+(?:bạn|ban|nhé|nhe|nha|ạ|nhiều|nhieu|lắm|lam|you|so much|very much))*"
+
+
+def _intent_pattern(alternatives):
+    return re.compile(
+        rf"^\s*(?:{alternatives}){_FILLER}\s*[!.?]*\s*$", re.IGNORECASE
+    )
+
+
+_INTENT_PATTERNS = [
+    (_intent_pattern(r"xin chào|xin chao|chào|chao|hello|hi|hey"), GREETING_REPLY),
+    (_intent_pattern(r"cảm ơn|cám ơn|cam on|thanks?|thank you"), THANKS_REPLY),
+    (_intent_pattern(r"tạm biệt|tam biet|bye bye|bye|goodbye"), BYE_REPLY),
+    (
+        _intent_pattern(r"bạn là ai|ban la ai|bạn tên gì|ban ten gi|bạn là gì|ban la gi"),
+        WHOAMI_REPLY,
+    ),
+]
+
+
+def _match_intent(query):
+    """Return the canonical reply for a trivial utterance, or None"""
+    text = unicodedata.normalize("NFC", query)
+    for pattern, reply in _INTENT_PATTERNS:
+        if pattern.match(text):
+            return reply
+    return None
+
+
+# ==========================================
+# Intent-Specific Prompt
+# ==========================================
+# Unanchored (the fast path above only takes whole-message matches); run on
+# normalize_query() output. Order = relevance; at most two blocks are sent.
+_RULE_INTENT_PATTERNS = [
+    ("data_source", re.compile(r"dữ liệu|du lieu|nguồn|nguon|thu thập|thu thap|tâm anh|tam anh")),
+    ("capabilities", re.compile(r"làm được gì|lam duoc gi|có thể làm|co the lam|công cụ|cong cu|tool|chức năng|chuc nang")),
+    ("weather", re.compile(r"thời tiết|thoi tiet|weather|trời mưa|trời nắng")),
+    ("lifestyle", re.compile(r"món ăn|mon an|ăn gì|an gi|du lịch|du lich|giải trí|giai tri|phim|nhạc|food|travel|movie")),
+    ("whoami", re.compile(r"là ai|la ai|tên gì|ten gi")),
+    ("thanks", re.compile(r"cảm ơn|cám ơn|cam on|thank")),
+    ("bye", re.compile(r"tạm biệt|tam biet|bye")),
+    ("greeting", re.compile(r"^(xin chào|xin chao|chào|chao|hello|hi|hey)\b")),
+]
+
+
+def _match_rule_intents(normalized_query):
+    """Up to two rule-block intents for a normalized query ([] = unknown)"""
+    intents = [
+        intent
+        for intent, pattern in _RULE_INTENT_PATTERNS
+        if pattern.search(normalized_query)
+    ]
+    return intents[:2]
+
+
+def _compact_prompt(intents, user_turn):
+    """PERSONA + only the selected rule blocks + notes + user turn"""
+    parts = [PERSONA]
+    if "data_source" in intents:
+        parts.append(DATA_SOURCE_NOTE)
+    parts += [_rules_section(intents), NOTES, user_turn]
+    return "\n\n".join(parts)
+
+
+# ==========================================
+# Response Cache
+# ==========================================
+# Casual queries repeat heavily; serve repeats from memory instead of Gemini.
+# Keys are normalized queries (NFKC, lowercase, emoji-stripped).
+_RESPONSE_CACHE = cachetools.LRUCache(maxsize=2048)
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+
+def _cache_get(key):
+    with _RESPONSE_CACHE_LOCK:
+        return _RESPONSE_CACHE.get(key)
+
+
+def _cache_put(key, response):
+    # LLM.generate returns an apology string instead of raising; never cache those
+    if response and not response.startswith(ERROR_REPLY_PREFIX):
+        with _RESPONSE_CACHE_LOCK:
+            _RESPONSE_CACHE[key] = response
+
+
+# ==========================================
+# Gemini Cached Context
+# ==========================================
+# SYSTEM_TEMPLATE is registered once with Gemini context caching so each call
+# only sends the user turn. Gemini rejects caches below its minimum token
+# count, so failures disable the cache for one TTL and fall back to the
+# inline prompt.
+_CONTEXT_CACHE_TTL_SECONDS = 3600
+_CONTEXT_CACHE_LOCK = threading.Lock()
+_cached_chat_model = None
+_cached_chat_model_expiry = 0.0
+
+
+def _get_cached_chat_model():
+    """Get the Gemini model bound to the cached SYSTEM_TEMPLATE (None if unavailable)"""
+    global _cached_chat_model, _cached_chat_model_expiry
+
+    with _CONTEXT_CACHE_LOCK:
+        now = time.time()
+        if now < _cached_chat_model_expiry:
+            return _cached_chat_model
+
+        try:
+            import google.generativeai as genai
+            from google.generativeai import caching
+
+            _get_chat_llm()  # Ensures genai.configure() has run
+            model_name, temperature, _ = _CHAT_LLM_CONFIG
+            cache = caching.CachedContent.create(
+                model=model_name,
+                system_instruction=SYSTEM_TEMPLATE,
+                ttl=datetime.timedelta(seconds=_CONTEXT_CACHE_TTL_SECONDS),
+            )
+            _cached_chat_model = genai.GenerativeModel.from_cached_content(
+                cached_content=cache,
+                generation_config=genai.GenerationConfig(
+                    temperature=temperature,
+                    max_output_tokens=_CHAT_MAX_OUTPUT_TOKENS,
+                    **_CHAT_GENERATION_CONFIG,
+                ),
+            )
+            logger.info("Gemini context cache created for general_chat")
+        except Exception as e:
+            logger.warning("Context cache unavailable, using inline prompt: %s", e)
+            _cached_chat_model = None
+
+        # Refresh slightly before the server-side TTL expires
+        _cached_chat_model_expiry = now + _CONTEXT_CACHE_TTL_SECONDS - 60
+        return _cached_chat_model
+
+
+def _generate_with_cached_context(user_turn):
+    """Generate using the cached system context; None means use the inline prompt"""
+    global _cached_chat_model_expiry
+
+    model = _get_cached_chat_model()
+    if model is None:
+        return None
+    try:
+        return _get_chat_llm().generate_content(user_turn, model=model)
+    except Exception as e:
+        logger.warning("Cached context call failed: %s", e)
+        with _CONTEXT_CACHE_LOCK:
+            _cached_chat_model_expiry = 0.0  # Recreate (e.g. expired) on next call
+        return None
+
+
+async def _agenerate_with_cached_context(user_turn):
+    """Async variant of _generate_with_cached_context"""
+    global _cached_chat_model_expiry
+
+    model = await asyncio.to_thread(_get_cached_chat_model)
+    if model is None:
+        return None
+    try:
+        return await _get_chat_llm().agenerate_content(user_turn, model=model)
+    except Exception as e:
+        logger.warning("Cached context call failed: %s", e)
+        with _CONTEXT_CACHE_LOCK:
+            _cached_chat_model_expiry = 0.0
+        return None
 
 
 # ==========================================
@@ -58,116 +353,186 @@ def general_chat(query: str) -> str:
         str: Friendly conversational response
     """
     try:
-        print(f"\nGENERAL CHAT TOOL CALLED")
-        print(f"   Query: {query}")
-
-        # Import LLM (lazy loading)
-        from backend.routes.rag.llms import LLM
-
-        # Initialize LLM for chat with higher temperature for natural conversation
-        llm = LLM(
-            model_name="models/gemini-2.5-flash",
-            temperature=0.7,  # Higher temp for more natural, creative chat
-            language="vi",
-        )
-
-        # Build professional chat prompt with personality
-        chat_prompt = f"""Ban la VieMedChat - tro ly AI y te than thien va chuyen nghiep.
-
-TINH CACH:
-- Than thien, nhiet tinh, luon san sang giup do
-- Chuyen nghiep nhung khong cung nhac
-- Biet lang nghe va thau hieu
-- Tra loi ngan gon, tu nhien (1-3 cau)
-
-VAI TRO:
-Ban la tro ly AI chuyen ve y te, co the:
-- Tu van ve trieu chung, benh ly, thuoc men
-- Tinh toan cac chi so suc khoe (BMI, v.v.)
-- Tro chuyen than thien ve cac chu de thuong ngay
-
-NGUON DU LIEU:
-- Du lieu y te duoc thu thap tu Benh vien Da khoa Tam Anh
-- Co so du lieu chuyen sau ve cac benh ly, trieu chung, va dieu tri
+        logger.debug("general_chat called query=%s", query)
+
+        # Fast path - canonical replies for trivial intents (no LLM call)
+        reply = _match_intent(query)
+        if reply is not None:
+            logger.debug("general_chat intent fast path hit")
+            return reply
+
+        # Repeat queries - served from the in-process response cache
+        cache_key = normalize_query(query)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.debug("general_chat response cache hit")
+            return cached
+
+        # Shared LLM for chat
+        llm = _get_chat_llm()
+
+        # Only the user turn varies; the static instructions live in SYSTEM_TEMPLATE
+        user_turn = USER_TURN_TEMPLATE.format(query=query)
+
+        intents = _match_rule_intents(cache_key)
+        if intents:
+            # Known intent - compact prompt with only the relevant rule blocks
+            response = llm.generate(_compact_prompt(intents, user_turn))
+        else:
+            # Unknown intent - cached full context first, inline prompt as fallback
+            response = _generate_with_cached_context(user_turn)
+            if response is None:
+                response = llm.generate(f"{SYSTEM_TEMPLATE}\n\n{user_turn}")
 
-NGUOI DUNG NOI:
-"{query}"
+        response = response.strip()
+        _cache_put(cache_key, response)
+        return response
 
-HUONG DAN TRA LOI:
+    except Exception as e:
+        logger.exception("Error in general_chat: %s", e)
 
-1. Neu chao hoi (xin chao, hi, hello):
-   Tra loi: "Xin chao! Toi la VieMedChat, tro ly AI y te. Toi co the giup gi cho ban hom nay?"
+        return _fallback_reply(query)
 
-2. Neu hoi ve ban than (ban la ai, ten gi, lam gi):
-   Tra loi: "Toi la VieMedChat, tro ly AI chuyen ve y te. Toi co the giup ban tu van ve suc khoe, trieu chung benh, thuoc men, va cac van de y te khac!"
 
-3. Neu hoi ve kha nang/tool (ban co the lam gi, co nhung tool nao):
-   Tra loi: "Toi co 3 cong cu chinh:
-   - Tim kiem thong tin y te (trieu chung, benh, thuoc)
-   - Tinh toan chi so suc khoe (BMI, v.v.)
-   - Tro chuyen tu van than thien
-   Ban can toi giup gi nhe?"
+async def general_chat_async(query: str) -> str:
+    """
+    Async variant of general_chat (same behavior)
 
-4. Neu hoi ve nguon du lieu (du lieu tu dau, thu thap o dau):
-   Tra loi: "Du lieu y te cua toi duoc thu thap tu Benh vien Da khoa Tam Anh, mot trong nhung benh vien uy tin hang dau Viet Nam. Toi co the giup ban tim hieu ve cac van de suc khoe dua tren nguon thong tin nay!"
+    Uses Gemini's generate_content_async so concurrent chats do not each
+    block a worker thread for the full round-trip.
 
-5. Neu cam on (cam on, thanks):
-   Tra loi: "Rat vui duoc giup do ban! Neu co thac mac gi ve suc khoe, dung ngai hoi nhe!"
+    Args:
+        query: User's casual question
 
-6. Neu tam biet (bye, tam biet):
-   Tra loi: "Tam biet! Chuc ban luon khoe manh! Hen gap lai!"
+    Returns:
+        str: Friendly conversational response
+    """
+    try:
+        logger.debug("general_chat_async called query=%s", query)
 
-7. Neu hoi thoi tiet:
-   Tra loi: "Toi khong co kha nang xem thoi tiet, nhung toi co the tu van ve suc khoe cho ban! Ban co cau hoi gi ve y te khong?"
+        reply = _match_intent(query)
+        if reply is not None:
+            logger.debug("general_chat intent fast path hit")
+            return reply
 
-8. Neu hoi mon an/du lich/giai tri:
-   Tra loi: "Do la chu de thu vi! Tuy nhien, toi chuyen ve y te hon. Nhung neu ban can tu van dinh duong hoac che do an uong cho suc khoe, toi rat san long giup do!"
+        cache_key = normalize_query(query)
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.debug("general_chat response cache hit")
+            return cached
 
-9. Neu tro chuyen chung chung:
-   Tra loi than thien, tu nhien, nhung nhe nhang dan dat ve chu de y te
+        llm = _get_chat_llm()
+        user_turn = USER_TURN_TEMPLATE.format(query=query)
 
-LUU Y QUAN TRONG:
-- Tra loi NGAN GON (1-3 cau)
-- Tu nhien, khong rap khuon
-- Luon the hien su than thien
-- Nhe nhang nhac ve vai tro tro ly y te
-- KHONG nhac den Google, mo hinh ngon ngu, hay cong nghe AI
-- Chi noi ve nguon du lieu tu Benh vien Tam Anh khi duoc hoi
+        intents = _match_rule_intents(cache_key)
+        if intents:
+            response = await llm.agenerate(_compact_prompt(intents, user_turn))
+        else:
+            response = await _agenerate_with_cached_context(user_turn)
+            if response is None:
+                response = await llm.agenerate(f"{SYSTEM_TEMPLATE}\n\n{user_turn}")
 
-Hay tra loi:"""
+        response = response.strip()
+        _cache_put(cache_key, response)
+        return response
 
-        # Generate response
-        response = llm.generate(chat_prompt)
+    except Exception as e:
+        logger.exception("Error in general_chat_async: %s", e)
+        return _fallback_reply(query)
 
-        print(f"   Response generated")
 
-        return response.strip()
+def general_chat_stream(query: str):
+    """
+    Streaming variant of general_chat - yields text as Gemini generates it
 
-    except Exception as e:
-        print(f"   Error in general_chat: {e}")
-        import traceback
+    Fast-path and cached replies are yielded whole. Streamed replies use the
+    extended token cap, since a reply already on screen cannot be regenerated
+    if it hits the tight cap mid-sentence.
 
-        traceback.print_exc()
+    Args:
+        query: User's casual question
 
-        # Fallback responses
-        query_lower = query.lower()
+    Yields:
+        str: Response text chunks
+    """
+    logger.debug("general_chat_stream called query=%s", query)
 
-        if any(greeting in query_lower for greeting in ["chao", "hello", "hi", "hey"]):
-            return "Xin chao! Toi la VieMedChat, tro ly AI y te. Toi co the giup gi cho ban hom nay?"
+    reply = _match_intent(query)
+    if reply is not None:
+        yield reply
+        return
 
-        elif any(thanks in query_lower for thanks in ["cam on", "thank", "thanks"]):
-            return (
-                "Rat vui duoc giup do ban! Neu co cau hoi gi khac, dung ngai hoi nhe!"
-            )
+    cache_key = normalize_query(query)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        yield cached
+        return
 
-        elif any(bye in query_lower for bye in ["tam biet", "bye", "goodbye"]):
-            return "Tam biet! Chuc ban mot ngay tot lanh!"
+    parts = []
+    try:
+        llm = _get_chat_llm()
+        user_turn = USER_TURN_TEMPLATE.format(query=query)
+
+        intents = _match_rule_intents(cache_key)
+        model = None if intents else _get_cached_chat_model()
+        if intents:
+            model, prompt = llm.model, _compact_prompt(intents, user_turn)
+        elif model is None:
+            model, prompt = llm.model, f"{SYSTEM_TEMPLATE}\n\n{user_turn}"
+        else:
+            prompt = user_turn
+
+        stream = model.generate_content(
+            prompt,
+            stream=True,
+            generation_config={
+                "max_output_tokens": _CHAT_MAX_OUTPUT_TOKENS * TRUNCATION_EXTEND_FACTOR
+            },
+        )
+        for chunk in stream:
+            # Finish-only or safety-blocked chunks have no text parts
+            text = _chunk_text(chunk)
+            if text:
+                parts.append(text)
+                yield text
 
-        elif "ten" in query_lower or "la ai" in query_lower:
-            return "Toi la VieMedChat, tro ly AI y te, duoc thiet ke de giup ban tu van ve cac van de suc khoe."
+        _cache_put(cache_key, "".join(parts).strip())
 
-        else:
-            return "Toi la VieMedChat, tro ly AI y te. Ban co cau hoi gi ve suc khoe khong? Toi san sang ho tro!"
+    except Exception as e:
+        logger.exception("Error in general_chat_stream: %s", e)
+        if not parts:
+            yield _fallback_reply(query)
+
+
+# Fallback keyword patterns, compiled once (substring semantics, first match wins)
+_FALLBACK_REPLIES = [
+    (
+        re.compile(r"chao|hello|hi|hey"),
+        "Xin chao! Toi la VieMedChat, tro ly AI y te. Toi co the giup gi cho ban hom nay?",
+    ),
+    (
+        re.compile(r"cam on|thanks?"),
+        "Rat vui duoc giup do ban! Neu co cau hoi gi khac, dung ngai hoi nhe!",
+    ),
+    (
+        re.compile(r"tam biet|bye"),
+        "Tam biet! Chuc ban mot ngay tot lanh!",
+    ),
+    (
+        re.compile(r"ten|la ai"),
+        "Toi la VieMedChat, tro ly AI y te, duoc thiet ke de giup ban tu van ve cac van de suc khoe.",
+    ),
+]
+_FALLBACK_DEFAULT = "Toi la VieMedChat, tro ly AI y te. Ban co cau hoi gi ve suc khoe khong? Toi san sang ho tro!"
+
+
+def _fallback_reply(query: str) -> str:
+    """Canned reply used when the LLM call fails"""
+    query_lower = query.lower()
+    for pattern, reply in _FALLBACK_REPLIES:
+        if pattern.search(query_lower):
+            return reply
+    return _FALLBACK_DEFAULT
 
 
 # ==========================================
@@ -183,6 +548,7 @@ def get_general_chat_tool():
     return Tool(
         name="general_chat",
         func=general_chat,
+        coroutine=general_chat_async,
         description="""
             Cong cu tro chuyen thong thuong, xu ly cac cau hoi chung chung.
             
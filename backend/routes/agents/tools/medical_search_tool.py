@@ -6,13 +6,55 @@ Agent sẽ tự động chọn tool phù hợp
 from langchain.tools import Tool
 from pydantic import BaseModel, Field  # ✅ FIX: Import từ pydantic v2
 from typing import Optional
-import sys
-import os
+import io
+import asyncio
+import threading
+import cachetools
+import logging
 
-# Add backend to path
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../..")))
+# Same top-level package path the app uses (backend/ is the working directory),
+# so the RAG service singleton preloaded at startup is the one used here
+from utils.rag_service import get_rag_service
+from routes.rag.utils import normalize_query
 
-from backend.utils.rag_service import get_rag_service
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# 🗃️ Search Result Cache
+# ==========================================
+# Repeated medical queries skip retrieval (embedding + Pinecone + rerank).
+# TTL so corpus/index updates become visible within an hour.
+SEARCH_TOP_K = 5
+_SEARCH_CACHE = cachetools.TTLCache(maxsize=4096, ttl=3600)
+_SEARCH_CACHE_LOCK = threading.Lock()
+
+# ==========================================
+# 📝 Result Formatting
+# ==========================================
+SEARCH_RESULT_HEADER = "Thông tin y tế từ cơ sở dữ liệu:\n\n"
+SEARCH_NO_RESULT_REPLY = "Không tìm thấy thông tin y tế liên quan trong cơ sở dữ liệu."
+SEARCH_ERROR_REPLY = "Xin lỗi, đã có lỗi khi tìm kiếm thông tin y tế."
+# Tool outputs that must not be cached (here or by the agent's answer cache)
+SEARCH_FAILURE_REPLIES = (SEARCH_NO_RESULT_REPLY, SEARCH_ERROR_REPLY)
+SEARCH_RESULT_FOOTER = """📌 YÊU CẦU:
+- Hãy tổng hợp TẤT CẢ thông tin chi tiết từ các tài liệu trên
+- Trình bày đầy đủ: triệu chứng, nguyên nhân, chẩn đoán, điều trị
+- Sử dụng bullet points để dễ đọc
+- Trả lời bằng TIẾNG VIỆT, RÕ RÀNG, CHI TIẾT, CHÍNH XÁC, DỄ HIỂU"""
+
+
+def _format_search_result(context_docs):
+    """Build the tool output in one buffer (no per-document f-string temporaries)"""
+    buf = io.StringIO()
+    buf.write(SEARCH_RESULT_HEADER)
+    for i, doc in enumerate(context_docs, 1):
+        buf.write("📄 Tài liệu ")
+        buf.write(str(i))
+        buf.write(":\n")
+        buf.write(doc)
+        buf.write("\n\n")
+    buf.write(SEARCH_RESULT_FOOTER)
+    return buf.getvalue()
 
 
 # ==========================================
@@ -51,38 +93,73 @@ def search_medical_documents(query: str) -> str:
         str: Relevant medical information from knowledge base
     """
     try:
-        print(f"\n🔍 TOOL CALLED: search_medical_documents")
-        print(f"   Query: {query}")
+        logger.debug("search_medical_documents called query=%s", query)
+
+        cache_key = (normalize_query(query), SEARCH_TOP_K)
+        with _SEARCH_CACHE_LOCK:
+            cached = _SEARCH_CACHE.get(cache_key)
+        if cached is not None:
+            logger.debug("search_medical_documents cache hit")
+            return cached
 
         # Get RAG service
         rag = get_rag_service(use_reranker=True)
 
         # Retrieve context - RAG service sẽ tự động retrieve top_k*2 candidates rồi rerank về top_k
-        context_docs = rag.retrieve_context(query=query, top_k=5, search_type="hybrid")
+        context_docs = rag.retrieve_context(
+            query=query, top_k=SEARCH_TOP_K, search_type="hybrid"
+        )
 
         if not context_docs or len(context_docs) == 0:
-            return "Không tìm thấy thông tin y tế liên quan trong cơ sở dữ liệu."
+            return SEARCH_NO_RESULT_REPLY
+
+        logger.debug("Retrieved %d documents", len(context_docs))
 
         # Format context for LLM
-        formatted_context = "\n\n".join(
-            [f"📄 Tài liệu {i+1}:\n{doc}" for i, doc in enumerate(context_docs)]
-        )
+        result = _format_search_result(context_docs)
 
-        print(f"✅ Retrieved {len(context_docs)} documents")
+        with _SEARCH_CACHE_LOCK:
+            _SEARCH_CACHE[cache_key] = result
+        return result
 
-        return f"""Thông tin y tế từ cơ sở dữ liệu:
+    except Exception as e:
+        logger.exception("Error in search_medical_documents: %s", e)
+        return SEARCH_ERROR_REPLY
 
-{formatted_context}
 
-📌 YÊU CẦU:
-- Hãy tổng hợp TẤT CẢ thông tin chi tiết từ các tài liệu trên
-- Trình bày đầy đủ: triệu chứng, nguyên nhân, chẩn đoán, điều trị
-- Sử dụng bullet points để dễ đọc
-- Trả lời bằng TIẾNG VIỆT, RÕ RÀNG, CHI TIẾT, CHÍNH XÁC, DỄ HIỂU"""
+async def search_medical_documents_async(query: str) -> str:
+    """
+    Async variant of search_medical_documents (shares its result cache)
+
+    Uses RAGService.aretrieve_context: BM25 and the Pinecone query are
+    awaited together, embedding and reranking run in worker threads, so the
+    event loop stays free for other requests.
+    """
+    try:
+        cache_key = (normalize_query(query), SEARCH_TOP_K)
+        with _SEARCH_CACHE_LOCK:
+            cached = _SEARCH_CACHE.get(cache_key)
+        if cached is not None:
+            logger.debug("search_medical_documents cache hit")
+            return cached
+
+        rag = await asyncio.to_thread(get_rag_service, True)
+        context_docs = await rag.aretrieve_context(
+            query=query, top_k=SEARCH_TOP_K, search_type="hybrid"
+        )
+
+        if not context_docs:
+            return SEARCH_NO_RESULT_REPLY
+
+        result = _format_search_result(context_docs)
+
+        with _SEARCH_CACHE_LOCK:
+            _SEARCH_CACHE[cache_key] = result
+        return result
 
     except Exception as e:
-        print(f"❌ Error in search_medical_documents: {e}")
-        return "Xin lỗi, đã có lỗi khi tìm kiếm thông tin y tế."
+        logger.exception("Error in search_medical_documents_async: %s", e)
+        return SEARCH_ERROR_REPLY
 
 
 # ==========================================
@@ -95,15 +172,6 @@ def get_medical_tools():
     Returns:
         list: LangChain Tool objects
     """
-    # Force reload modules to avoid caching issues
-    import importlib
-
-    # Reload tool modules if already imported
-    if "backend.routes.agents.tools.calculator_tool" in sys.modules:
-        importlib.reload(sys.modules["backend.routes.agents.tools.calculator_tool"])
-    if "backend.routes.agents.tools.general_chat_tool" in sys.modules:
-        importlib.reload(sys.modules["backend.routes.agents.tools.general_chat_tool"])
-
     # Import other tools
     from .calculator_tool import get_calculator_tool
     from .general_chat_tool import get_general_chat_tool
@@ -112,6 +180,7 @@ def get_medical_tools():
     medical_tool = Tool(
         name="search_medical_documents",
         func=search_medical_documents,
+        coroutine=search_medical_documents_async,
         description="""
             Tìm kiếm thông tin y tế từ cơ sở tri thức.
             
@@ -145,5 +214,5 @@ def get_medical_tools():
         raise ValueError("❌ general_chat_tool is None!")
 
     tools = [medical_tool, calculator_tool, general_chat_tool]
-    print(f"✅ Loaded {len(tools)} tools: medical_search, calculator, general_chat")
+    logger.info("Loaded %d tools: medical_search, calculator, general_chat", len(tools))
     return tools
@@ -3,6 +3,7 @@ from controllers.chat_controller import (
     create_conversation,
     get_conversations,
     send_message,
+    send_message_stream,
     get_messages,
     update_conversation,
     delete_conversation 
@@ -16,6 +17,7 @@ chat_bp = Blueprint('chat', __name__)
 chat_bp.route('/conversations', methods=['POST'])(token_required(create_conversation))
 chat_bp.route('/conversations', methods=['GET'])(token_required(get_conversations))
 chat_bp.route('/messages', methods=['POST'])(token_required(send_message))
+chat_bp.route('/messages/stream', methods=['POST'])(token_required(send_message_stream))
 # chat_bp.route('/messages', methods=['GET'])(token_required(get_messages))
 chat_bp.route('/messages/<int:conversation_id>', methods=['GET'])(token_required(get_messages))
 
@@ -0,0 +1,79 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collect items submitted concurrently from many threads and process them
+    with ONE call to `batch_fn` (e.g. one encoder forward pass for N queries).
+
+    Batching is adaptive: while the worker is busy with batch N, new requests
+    queue up and become batch N+1, so a lone request pays no extra wait.
+    `flush_ms` optionally holds each batch open a little longer.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, flush_ms=0.0, name="micro-batcher"):
+        """
+        Args:
+            batch_fn: Callable list[item] -> list[result] (same order)
+            max_batch_size: Maximum items per batch_fn call
+            flush_ms: Extra time to wait for more items after the first one
+            name: Worker thread name
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.flush_ms = flush_ms
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item) -> Future:
+        """Queue an item; returns a Future resolved with its result"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Blocking helper: submit and wait for the result"""
+        return self.submit(item).result()
+
+    def _ensure_started(self):
+        # Worker starts on first use (CLI/ingestion paths never spawn it)
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name=self.name, daemon=True
+                    )
+                    self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
@@ -1,26 +1,151 @@
 import os
 import time
+import asyncio
+import logging
 import argparse
+import threading
+from collections import deque
+import cachetools
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_exponential
 from typing import List, Dict, Any
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
+from pinecone.exceptions import NotFoundException
+
+# gRPC client (pinecone[grpc]) is only used for bulk upserts
+try:
+    from pinecone.grpc import PineconeGRPC
+except ImportError:
+    PineconeGRPC = None
 
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain.embeddings.base import Embeddings
 
+logger = logging.getLogger(__name__)
+
 try:
     from utils import load_corpus
 except ImportError:
     try:
         from .utils import load_corpus
     except ImportError:
-        print("⚠️ Warning: load_corpus not available")
+        logger.warning("load_corpus not available")
         load_corpus = None
 
+try:
+    from batching import MicroBatcher
+except ImportError:
+    from .batching import MicroBatcher
+
+try:
+    from ingest_cache import IngestCache, document_id
+except ImportError:
+    from .ingest_cache import IngestCache, document_id
+
 load_dotenv()
 
+# Upsert errors worth retrying: rate limit / server side (REST status or gRPC code)
+_RETRYABLE_GRPC_CODES = {"RESOURCE_EXHAUSTED", "UNAVAILABLE", "INTERNAL", "DEADLINE_EXCEEDED"}
+UPSERT_MAX_RETRIES = 5
+
+
+def _is_retryable_upsert_error(e) -> bool:
+    status = getattr(e, "status", None)
+    if isinstance(status, int):
+        return status == 429 or 500 <= status < 600
+    code = getattr(e, "code", None)
+    if callable(code):
+        try:
+            return code().name in _RETRYABLE_GRPC_CODES
+        except Exception:
+            return False
+    return False
+
+
+# int8 payload scale for unit-norm embeddings (cosine is scale-invariant,
+# so queries stay float and need no rescaling)
+INT8_SCALE = 127
+
+
+def _quantize_int8(embeddings):
+    """
+    Quantize L2-normalized embeddings to int8 range
+
+    Args:
+        embeddings: (N, D) array-like of unit-norm vectors
+
+    Returns:
+        list[list[int]]: Values in [-128, 127] (JSON ints instead of floats)
+    """
+    # One (N, D) copy, then scale/round/clip in place: whole-chunk NumPy ufuncs
+    # already run in C without the GIL, so a Numba kernel would not beat this
+    x = np.array(embeddings, dtype=np.float32)
+    np.multiply(x, INT8_SCALE, out=x)
+    np.rint(x, out=x)
+    np.clip(x, -128, 127, out=x)
+    return x.astype(np.int8).tolist()
+
+
+def _cuda_batch_size(device, per_gb=16, max_batch_size=128):
+    """
+    Largest power-of-two encode batch that fits the free VRAM
+    (~16 bge-m3 sequences per free GB in FP16)
+    """
+    try:
+        free, _ = torch.cuda.mem_get_info(torch.device(device))
+    except Exception:
+        return 32
+    fit = max(1, int(free // (1024 ** 3)) * per_gb)
+    batch_size = 1
+    while batch_size * 2 <= min(fit, max_batch_size):
+        batch_size *= 2
+    return batch_size
+
+
+def _attn_implementation():
+    """FlashAttention-2 when the flash_attn kernels are installed, else PyTorch SDPA"""
+    try:
+        import flash_attn  # noqa: F401
+        return "flash_attention_2"
+    except ImportError:
+        return "sdpa"
+
+
+def _as_query_vector(embedding):
+    """
+    Compact, read-only float32 copy of a query embedding for the query cache
+    (4 bytes per value instead of a 28-byte Python float object)
+    """
+    vector = np.array(embedding, dtype=np.float32)
+    vector.flags.writeable = False
+    return vector
+
+
+# Loaded SentenceTransformer models, shared by every Embedding instance
+_SENTENCE_TRANSFORMERS = {}
+_SENTENCE_TRANSFORMERS_LOCK = threading.Lock()
+
+
+class EmbeddingError(Exception):
+    """
+    Raised by embed_documents when some documents still fail after retries
+
+    Attributes:
+        failed: List of (index, text) for documents that could not be embedded
+        embeddings: Embeddings in input order, None at failed positions
+    """
+
+    def __init__(self, failed, embeddings):
+        self.failed = failed
+        self.embeddings = embeddings
+        super().__init__(f"{len(failed)} document(s) failed to embed")
+
 
 # ==========================================
 # ✅ Custom Google Embeddings Class
@@ -31,62 +156,214 @@ class GoogleGenAIEmbeddings(Embeddings):
     Supports multilingual embedding with task-specific optimization
     """
     
-    def __init__(self, api_key: str, model: str = "models/text-multilingual-embedding-002"):
+    # Max texts per batched embed_content request
+    BATCH_SIZE = 100
+    
+    def __init__(self, api_key: str, model: str = "models/text-multilingual-embedding-002",
+                 concurrency: int = 32):
         """
         Initialize Google GenAI Embeddings
         
         Args:
             api_key: Google API key
             model: Embedding model name (default: text-multilingual-embedding-002)
+            concurrency: Max parallel embedding requests (bounded by API quota)
         """
         genai.configure(api_key=api_key)
         self.model = model
-        print(f"✅ Initialized Google GenAI Embeddings with model: {model}")
+        self.concurrency = concurrency
+        logger.info("Initialized Google GenAI Embeddings with model: %s", model)
+    
+    @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=0.5, max=8), reraise=True)
+    def _embed_one(self, text: str) -> List[float]:
+        """Embed a single document (retried with exponential backoff)"""
+        result = genai.embed_content(
+            model=self.model,
+            content=text,
+            task_type="retrieval_document"
+        )
+        return result["embedding"]
+    
+    def _embed_one_safe(self, text: str):
+        """Per-item fallback; returns None (never a fake vector) on terminal failure"""
+        try:
+            return self._embed_one(text)
+        except Exception as e:
+            logger.warning("Error embedding document: %.100s", e)
+            return None
+    
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=0.5, max=8),
+        retry=retry_if_not_exception_type(google_exceptions.ClientError),
+        reraise=True,
+    )
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed many documents in ONE request (content=list)"""
+        result = genai.embed_content(
+            model=self.model,
+            content=texts,
+            task_type="retrieval_document"
+        )
+        return result["embedding"]
+    
+    def _embed_chunk(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed one chunk via the batch request
+        
+        4xx errors (e.g. one text over the token limit) are bisected so only
+        the offending item falls back to the per-item path.
+        """
+        try:
+            return self._embed_batch(texts)
+        except google_exceptions.ClientError as e:
+            if len(texts) == 1:
+                return [self._embed_one_safe(texts[0])]
+            logger.warning("Batch rejected (%.80s), bisecting %d texts", e, len(texts))
+            mid = len(texts) // 2
+            return self._embed_chunk(texts[:mid]) + self._embed_chunk(texts[mid:])
+        except Exception as e:
+            logger.warning("Batch embedding failed (%.80s), falling back to per-item", e)
+            return [self._embed_one_safe(text) for text in texts]
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """
         Embed search documents
         
+        Texts are sent BATCH_SIZE at a time (one request per chunk instead of
+        one per text); chunks are issued in parallel on a thread pool.
+        Output order matches input order.
+        
         Args:
             texts: List of documents to embed
         
         Returns:
             List of embedding vectors
+        
+        Raises:
+            EmbeddingError: If some documents failed after retries (carries
+                the failed indices and the partial results)
         """
-        embeddings = []
-        for text in texts:
-            try:
-                result = genai.embed_content(
-                    model=self.model,
-                    content=text,
-                    task_type="retrieval_document"
-                )
-                embeddings.append(result["embedding"])
-            except Exception as e:
-                print(f"⚠️ Error embedding document: {str(e)[:100]}")
-                embeddings.append([0.0] * 768)
+        if not texts:
+            return []
+        chunks = [texts[i:i + self.BATCH_SIZE] for i in range(0, len(texts), self.BATCH_SIZE)]
+        workers = min(self.concurrency, len(chunks))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            embeddings = [emb for chunk_embs in ex.map(self._embed_chunk, chunks) for emb in chunk_embs]
+        
+        failed = [(i, texts[i]) for i, emb in enumerate(embeddings) if emb is None]
+        if failed:
+            raise EmbeddingError(failed, embeddings)
         return embeddings
     
+    @retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=0.5, max=8), reraise=True)
     def embed_query(self, text: str) -> List[float]:
         """
-        Embed query text
+        Embed query text (retried with exponential backoff)
         
         Args:
             text: Query text to embed
         
         Returns:
             Embedding vector
+        
+        Raises:
+            Exception: If the API keeps failing (a zero vector would silently
+                return arbitrary matches)
         """
-        try:
-            result = genai.embed_content(
-                model=self.model,
-                content=text,
-                task_type="retrieval_query"
+        result = genai.embed_content(
+            model=self.model,
+            content=text,
+            task_type="retrieval_query"
+        )
+        return result["embedding"]
+
+
+# ==========================================
+# ⚡ ONNX Runtime Embeddings (CPU)
+# ==========================================
+class OnnxEmbeddings(Embeddings):
+    """
+    BGE-style encoder exported to ONNX and run with ONNX Runtime
+
+    Keeps PyTorch/Python overhead off the CPU inference path; optional
+    dynamic int8 quantization (AVX512-VNNI) roughly halves it again.
+    Requires `optimum[onnxruntime]` (imported lazily, only when enabled).
+    The export is cached under cache_dir so it only happens once.
+    """
+
+    def __init__(self, model_name="BAAI/bge-m3", cache_dir=None, quantize=False,
+                 batch_size=32, max_length=512):
+        """
+        Args:
+            model_name: HuggingFace model id
+            cache_dir: Directory for the exported ONNX model
+            quantize: Apply dynamic int8 quantization
+            batch_size: Texts per forward pass
+            max_length: Token truncation length
+        """
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+        export_dir = os.path.join(cache_dir or "cache", "onnx", model_name.replace("/", "__"))
+        if not os.path.isdir(export_dir):
+            logger.info("Exporting %s to ONNX (one-time)", model_name)
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(export_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+
+        model_dir, file_name = export_dir, "model.onnx"
+        if quantize:
+            from optimum.onnxruntime import ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+            model_dir = export_dir + "-int8"
+            if not os.path.isdir(model_dir):
+                logger.info("Quantizing ONNX model to int8 (one-time)")
+                quantizer = ORTQuantizer.from_pretrained(export_dir)
+                quantizer.quantize(
+                    save_dir=model_dir,
+                    quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False),
+                )
+                AutoTokenizer.from_pretrained(export_dir).save_pretrained(model_dir)
+            file_name = "model_quantized.onnx"
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=file_name)
+
+    def _encode(self, texts):
+        """CLS-pooled, L2-normalized embeddings (same pooling as the bge-m3 SentenceTransformer config)"""
+        # Length-sorted batches keep padding (wasted FLOPs) to a minimum
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            inputs = self.tokenizer(
+                [texts[i] for i in idx],
+                padding="longest",
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
             )
-            return result["embedding"]
-        except Exception as e:
-            print(f"⚠️ Error embedding query: {str(e)}")
-            return [0.0] * 768
+            hidden = self.model(
+                input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"]
+            ).last_hidden_state
+            cls = np.asarray(hidden[:, 0], dtype=np.float32)
+            cls /= np.linalg.norm(cls, axis=1, keepdims=True)
+            for i, vec in zip(idx, cls):
+                embeddings[i] = vec.tolist()
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0]
 
 
 # ==========================================
@@ -126,7 +403,9 @@ class Embedding:
     """
     
     def __init__(self, model_name=None, device="cpu", cache_dir=None,
-                 index_name="medical-chatbot", google_api_key=None, pinecone_api_key=None):
+                 index_name="medical-chatbot", google_api_key=None, pinecone_api_key=None,
+                 pool_threads=30, use_onnx=False, onnx_quantize=False,
+                 ingest_cache_path=None):
         """
         Initialize embedding model and Pinecone
         
@@ -137,10 +416,17 @@ class Embedding:
             index_name: Pinecone index name
             google_api_key: Google API key (if model_name="google")
             pinecone_api_key: Pinecone API key (required)
+            pool_threads: Concurrent Pinecone requests (parallel upserts)
+            use_onnx: Run the HuggingFace model with ONNX Runtime (CPU)
+            onnx_quantize: Dynamic int8 quantization for the ONNX model
+            ingest_cache_path: SQLite file recording upserted ids; unchanged
+                documents are skipped on re-ingestion (None = always upsert)
         """
         self.model_name = model_name or "BAAI/bge-m3"
         self.device = device
         self.cache_dir = cache_dir
+        self.use_onnx = use_onnx
+        self.onnx_quantize = onnx_quantize
         self.index_name = index_name
         self.pinecone_api_key = pinecone_api_key or os.getenv("PINECONE_API_KEY")
         self.google_api_key = google_api_key or os.getenv("GOOGLE_API_KEY")
@@ -150,36 +436,118 @@ class Embedding:
             raise ValueError("❌ PINECONE_API_KEY is required!")
         
         # Initialize pipecone
-        self.pc = Pinecone(api_key=self.pinecone_api_key)
-        self.index = None
+        self.pool_threads = pool_threads
+        self.pc = Pinecone(api_key=self.pinecone_api_key, pool_threads=pool_threads)
+        self._index = None  # Resolved once via the `index` property
+        self._upsert_index = None  # gRPC index for ingestion (lazy)
+        self._index_ready = False  # Set once the index is known to exist
+        self.failed_documents = []  # Docs that failed to embed, for reprocessing
+        self.ingest_cache = IngestCache(ingest_cache_path) if ingest_cache_path else None
         
         # Initialize embedding model
         self._initialize_embedding_model()
+
+        # Concurrent similarity searches share one batched query-embedding pass
+        self._query_batcher = None
+        if self.model_name != "google":
+            self._query_batcher = MicroBatcher(
+                self.embed_model.embed_documents,
+                max_batch_size=32,
+                name="query-embedding-batcher",
+            )
+
+        # Repeated queries (FAQ traffic, retries, agent cache + search) embed once
+        self._query_cache = cachetools.LRUCache(maxsize=4096)
+        self._query_cache_lock = threading.Lock()
         
-        print(f"✅ Embedding class initialized")
-        print(f"   Model: {self.model_name}")
-        print(f"   Index: {self.index_name}")
-        print(f"   Device: {self.device}")
+        logger.info(
+            "Embedding initialized (model=%s, index=%s, device=%s)",
+            self.model_name, self.index_name, self.device,
+        )
     
+    @property
+    def index(self):
+        """Pinecone index handle, resolved once per instance"""
+        if self._index is None:
+            self._index = self.pc.Index(self.index_name)
+        return self._index
+
     def _initialize_embedding_model(self):
         """Initialize embedding model based on model_name"""
         if self.model_name == "google":
             if not self.google_api_key:
                 raise ValueError("❌ GOOGLE_API_KEY is required for model='google'!")
             
-            print("🔹 Using Google Generative AI Embeddings...")
+            logger.info("Using Google Generative AI Embeddings")
             self.embed_model = GoogleGenAIEmbeddings(
                 api_key=self.google_api_key,
                 model="models/text-multilingual-embedding-002"
             )
+        elif self.use_onnx:
+            logger.info("Using ONNX Runtime model: %s", self.model_name)
+            key = ("onnx", self.model_name, self.onnx_quantize)
+            with _SENTENCE_TRANSFORMERS_LOCK:
+                if key not in _SENTENCE_TRANSFORMERS:
+                    _SENTENCE_TRANSFORMERS[key] = OnnxEmbeddings(
+                        model_name=self.model_name,
+                        cache_dir=self.cache_dir,
+                        quantize=self.onnx_quantize,
+                    )
+                self.embed_model = _SENTENCE_TRANSFORMERS[key]
         else:
-            print(f"🔹 Using SentenceTransformer model: {self.model_name}")
-            self.embed_model = SentenceTransformerEmbeddings(
-                model_name=self.model_name,
-                model_kwargs={'device': self.device},
-                cache_folder=self.cache_dir,
-                encode_kwargs={'batch_size': 32, "normalize_embeddings": True}
-            )
+            logger.info("Using SentenceTransformer model: %s", self.model_name)
+            if self.device.startswith("cuda"):
+                # FP16 + fused attention, batch sized to the free VRAM
+                # (bge-m3 is trained/served in FP16)
+                try:
+                    batch_size = _cuda_batch_size(self.device)
+                    attn_implementation = _attn_implementation()
+                    logger.info("batch_size=%s, attention=%s", batch_size, attn_implementation)
+                    self.embed_model = self._load_sentence_transformer(
+                        batch_size=batch_size,
+                        torch_dtype=torch.float16,
+                        attn_implementation=attn_implementation,
+                    )
+                    return
+                except Exception as e:
+                    logger.warning("FP16 initialization failed, falling back to FP32: %s", e)
+            self.embed_model = self._load_sentence_transformer(batch_size=32)
+
+    def _load_sentence_transformer(self, batch_size, torch_dtype=None, attn_implementation=None):
+        """
+        Build the LangChain SentenceTransformer wrapper (optionally half precision)
+        
+        Shared process-wide per (model, device, dtype, batch size): several
+        Embedding instances never hold separate copies of the weights.
+        
+        No extra length sorting is done here: SentenceTransformer.encode
+        already sorts each call's inputs by length before batching (smart
+        batching) and restores the original order, and create_embedding
+        hands it whole 1000-document chunks.
+        """
+        key = (self.model_name, self.device, torch_dtype, batch_size, attn_implementation)
+        with _SENTENCE_TRANSFORMERS_LOCK:
+            if key not in _SENTENCE_TRANSFORMERS:
+                model_kwargs = {'device': self.device}
+                hf_kwargs = {}
+                if torch_dtype is not None:
+                    hf_kwargs['torch_dtype'] = torch_dtype
+                if attn_implementation is not None:
+                    hf_kwargs['attn_implementation'] = attn_implementation
+                if hf_kwargs:
+                    model_kwargs['model_kwargs'] = hf_kwargs
+                _SENTENCE_TRANSFORMERS[key] = SentenceTransformerEmbeddings(
+                    model_name=self.model_name,
+                    model_kwargs=model_kwargs,
+                    cache_folder=self.cache_dir,
+                    encode_kwargs={
+                        'batch_size': batch_size,
+                        "normalize_embeddings": True,
+                        "convert_to_numpy": True,
+                        "show_progress_bar": False,
+                    }
+                )
+            return _SENTENCE_TRANSFORMERS[key]
     
     def create_index(self, dimension=None, metric="cosine"):
         """
@@ -189,14 +557,25 @@ class Embedding:
             dimension: Embedding dimension (auto-detected if None)
             metric: Similarity metric (cosine, euclidean, dotproduct)
         """
+        # Already checked/created by this instance - no round-trip
+        if self._index_ready:
+            return self
+        
         if dimension is None:
             dimension = get_embedding_dimension(self.model_name)
         
-        existing_indexes = [index.name for index in self.pc.list_indexes()]
+        # Single lookup instead of listing every index in the project
+        try:
+            self.pc.describe_index(self.index_name)
+            exists = True
+        except NotFoundException:
+            exists = False
         
-        if self.index_name not in existing_indexes:
-            print(f"📦 Creating new Pinecone index: {self.index_name}")
-            print(f"📊 Dimension: {dimension}, Metric: {metric}")
+        if not exists:
+            logger.info(
+                "Creating Pinecone index %s (dimension=%s, metric=%s)",
+                self.index_name, dimension, metric,
+            )
             
             self.pc.create_index(
                 name=self.index_name,
@@ -208,88 +587,266 @@ class Embedding:
                 )
             )
             
-            print("⏳ Waiting for index to be ready...")
-            time.sleep(10)
-            print(f"✅ Index '{self.index_name}' created!")
+            logger.info("Waiting for index to be ready")
+            self._wait_until_ready()
+            logger.info("Index '%s' created", self.index_name)
         else:
-            print(f"ℹ️ Index '{self.index_name}' already exists.")
+            logger.info("Index '%s' already exists", self.index_name)
         
-        self.index = self.pc.Index(self.index_name)
+        self._index_ready = True
         return self
 
-    def create_embedding(self, splits, batch_size=100, namespace=""):
+    def _wait_until_ready(self, delays=(0.5, 1, 2, 4, 8, 16)):
+        """
+        Poll describe_index with exponential backoff until the index is ready
+        
+        Raises:
+            TimeoutError: Index still not ready after all polls
+        """
+        for delay in delays:
+            if self.pc.describe_index(self.index_name).status.get("ready"):
+                return
+            time.sleep(delay)
+        if self.pc.describe_index(self.index_name).status.get("ready"):
+            return
+        raise TimeoutError(
+            f"❌ Pinecone index '{self.index_name}' not ready after {sum(delays):.1f}s"
+        )
+
+    def _get_upsert_index(self):
+        """
+        Index handle for bulk async upserts: gRPC if available, otherwise
+        the REST index with a `pool_threads` connection pool
+
+        Returns:
+            Pinecone index supporting upsert(async_req=True)
+        """
+        if self._upsert_index is None:
+            if PineconeGRPC is not None:
+                try:
+                    grpc_client = PineconeGRPC(api_key=self.pinecone_api_key)
+                    self._upsert_index = grpc_client.Index(self.index_name)
+                except Exception as e:
+                    logger.warning("gRPC client unavailable, using REST upserts: %s", e)
+            if self._upsert_index is None:
+                self._upsert_index = self.pc.Index(self.index_name, pool_threads=self.pool_threads)
+        return self._upsert_index
+
+    def _upsert_with_backoff(self, index, upsert_kwargs, attempt=0):
+        """
+        Synchronous upsert that backs off only on 429/5xx
+        
+        Args:
+            index: Pinecone index handle
+            upsert_kwargs: Arguments for index.upsert
+            attempt: Retries already spent on this batch
+        
+        Returns:
+            int: Total retries spent on this batch
+        """
+        while True:
+            if attempt:
+                time.sleep(min(30, 0.25 * 2 ** attempt))
+            try:
+                index.upsert(**upsert_kwargs)
+                return attempt
+            except Exception as e:
+                if not _is_retryable_upsert_error(e) or attempt >= UPSERT_MAX_RETRIES:
+                    raise
+                attempt += 1
+
+    def create_embedding(self, splits, document_chunk_size=1000, upsert_batch_size=64,
+                         namespace="", max_inflight=None, quantize_int8=False):
         """
         Create embeddings and upload to Pinecone using direct API
         
+        Documents are embedded `document_chunk_size` at a time (one encoder
+        call per chunk) and upserted `upsert_batch_size` vectors per request
+        (well under Pinecone's ~4MB request limit). Upserts go out
+        asynchronously (gRPC when installed, else pooled REST) in a sliding
+        window, and the next chunk is encoded on a prefetch thread while the
+        current one is assembled and upserted.
+        
         Args:
             splits: List of documents
-            batch_size: Batch size for uploading
+            document_chunk_size: Documents per embedding call
+            upsert_batch_size: Vectors per upsert request
             namespace: Pinecone namespace (optional)
+            max_inflight: Maximum pending async upserts (default: pool_threads)
+            quantize_int8: Upsert int8-rounded values (x127) instead of float32.
+                ~4x smaller REST/JSON bodies; cosine index only. Check
+                recall@k on a held-out set before enabling for a new corpus
         
         Returns:
             self (for chaining)
         """
-        if not self.index:
-            self.index = self.pc.Index(self.index_name)
+        upsert_index = self._get_upsert_index()
+        max_inflight = max_inflight or self.pool_threads
         
-        print(f"\n{'='*60}")
-        print(f"🔄 Starting embedding process...")
-        print(f"📊 Total chunks: {len(splits)}")
-        print(f"📦 Batch size: {batch_size}")
-        print(f"{'='*60}\n")
+        # Deterministic ids: same content + source -> same vector, so a re-run
+        # overwrites instead of duplicating. Skip duplicates and (with an
+        # ingest cache) documents already in this index/namespace.
+        ids = [document_id(doc.page_content, doc.metadata) for doc in splits]
+        seen = set()
+        if self.ingest_cache is not None:
+            seen = self.ingest_cache.existing(self.index_name, namespace, ids)
+        keep = []
+        for n, vid in enumerate(ids):
+            if vid not in seen:
+                seen.add(vid)
+                keep.append(n)
+        skipped = len(splits) - len(keep)
+        splits = [splits[n] for n in keep]
         
-        total_batches = (len(splits) + batch_size - 1) // batch_size
-        successful_batches = 0
-        failed_batches = 0
+        logger.info(
+            "Embedding %d chunks (%d unchanged/duplicate skipped, chunk size %d, upsert batch %d)",
+            len(splits), skipped, document_chunk_size, upsert_batch_size,
+        )
+        if quantize_int8:
+            logger.info("int8-quantized payloads (scale %s)", INT8_SCALE)
         
-        for i in tqdm(range(0, len(splits), batch_size), 
-                      desc="🚀 Uploading to Pinecone",
-                      total=total_batches,
-                      unit="batch"):
-            batch = splits[i:i+batch_size]
-            
+        total_batches = (len(splits) + upsert_batch_size - 1) // upsert_batch_size
+        successful_batches = 0  # Failed = total - successful (includes skipped chunks)
+        total_retries = 0
+        batch_no = 0
+        pending = deque()  # (batch number, upsert future, upsert kwargs)
+        
+        def _record_retries(batch_no, retries):
+            nonlocal total_retries
+            if retries:
+                total_retries += retries
+                logger.debug("Batch %d upserted after %d retries", batch_no, retries)
+        
+        def _resolve(batch_no, future, upsert_kwargs):
+            nonlocal successful_batches
             try:
-                texts = [doc.page_content for doc in batch]
-                metadatas = [doc.metadata for doc in batch]
-                
-                # Embed documents
-                embeddings = self.embed_model.embed_documents(texts)
-                
-                # Create vectors
-                vectors = []
-                for j, (text, embedding, metadata) in enumerate(zip(texts, embeddings, metadatas)):
-                    vector_id = f"doc_{i+j}"
-                    vectors.append({
-                        "id": vector_id,
-                        "values": embedding,
-                        "metadata": {
-                            "text": text[:1000],
-                            **metadata
-                        }
-                    })
-                
-                # Upload to Pinecone
-                if namespace:
-                    self.index.upsert(vectors=vectors, namespace=namespace)
-                else:
-                    self.index.upsert(vectors=vectors)
-                
+                try:
+                    # REST returns an AsyncResult (.get), gRPC a Future (.result)
+                    if hasattr(future, "get"):
+                        future.get(timeout=60)
+                    else:
+                        future.result(timeout=60)
+                    retries = 0
+                except Exception as e:
+                    if not _is_retryable_upsert_error(e):
+                        raise
+                    # Throttled/server error - retry this batch synchronously with backoff
+                    retries = self._upsert_with_backoff(upsert_index, upsert_kwargs, attempt=1)
+                _record_retries(batch_no, retries)
                 successful_batches += 1
-                time.sleep(0.5)
-                
+                if self.ingest_cache is not None:
+                    self.ingest_cache.add(
+                        self.index_name,
+                        namespace,
+                        [vector["id"] for vector in upsert_kwargs["vectors"]],
+                    )
             except Exception as e:
-                failed_batches += 1
-                print(f"\n❌ Error at batch {i//batch_size + 1}: {str(e)[:200]}")
-                print("⏭️  Skipping and continuing...")
-                time.sleep(2)
+                logger.error("Upsert failed for batch %d: %.200s", batch_no, e)
+        
+        # Prepare texts, ids and Pinecone metadata once, outside the upload loop
+        texts_all = [doc.page_content for doc in splits]
+        metas_all = [
+            doc.metadata | {"text": text[:1000]}
+            for text, doc in zip(texts_all, splits)
+        ]
+        ids_all = [ids[n] for n in keep]
+        
+        def _embed_chunk(texts):
+            # Runs on the prefetch thread; the encoder releases the GIL
+            try:
+                return self.embed_model.embed_documents(texts), []
+            except EmbeddingError as e:
+                return e.embeddings, e.failed
+        
+        progress = tqdm(
+            total=len(splits),
+            desc="🚀 Uploading to Pinecone",
+            unit="doc",
+            disable=not logger.isEnabledFor(logging.INFO),
+        )
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-prefetch") as embed_pool:
+            next_future = embed_pool.submit(_embed_chunk, texts_all[:document_chunk_size]) if splits else None
+            for i in range(0, len(splits), document_chunk_size):
+                chunk = splits[i:i+document_chunk_size]
+                chunk_batches = (len(chunk) + upsert_batch_size - 1) // upsert_batch_size
+            
+                # Start encoding the next chunk while this one is upserted
+                embed_future = next_future
+                next_start = i + document_chunk_size
+                if next_start < len(splits):
+                    next_future = embed_pool.submit(
+                        _embed_chunk, texts_all[next_start:next_start+document_chunk_size]
+                    )
+            
+                try:
+                    # Failed items are skipped, never stored as zero vectors
+                    embeddings, failed = embed_future.result()
+                    if failed:
+                        for k, _ in failed:
+                            self.failed_documents.append(chunk[k])
+                        logger.warning(
+                            "%d document(s) in chunk %d failed to embed, queued for retry",
+                            len(failed), i // document_chunk_size + 1,
+                        )
+                
+                    if quantize_int8:
+                        valid = [k for k, emb in enumerate(embeddings) if emb is not None]
+                        quantized = _quantize_int8([embeddings[k] for k in valid]) if valid else []
+                        embeddings = [None] * len(embeddings)
+                        for k, q in zip(valid, quantized):
+                            embeddings[k] = q
+                
+                    # Create vectors (dict building stays in Python: Pinecone clients
+                    # need plain dicts, which Numba/Cython cannot emit more cheaply)
+                    vectors = [
+                        {"id": vector_id, "values": embedding, "metadata": metadata}
+                        for vector_id, embedding, metadata in zip(
+                            ids_all[i:i+document_chunk_size],
+                            embeddings,
+                            metas_all[i:i+document_chunk_size],
+                        )
+                        if embedding is not None
+                    ]
+                except Exception as e:
+                    batch_no += chunk_batches
+                    progress.update(len(chunk))
+                    logger.error(
+                        "Error embedding chunk %d, skipping: %.200s",
+                        i // document_chunk_size + 1, e,
+                    )
+                    continue
+            
+                # Upload to Pinecone, upsert_batch_size vectors per request
+                for b in range(0, len(vectors), upsert_batch_size):
+                    batch_no += 1
+                    upsert_kwargs = {"vectors": vectors[b:b+upsert_batch_size]}
+                    if namespace:
+                        upsert_kwargs["namespace"] = namespace
+                    try:
+                        future = upsert_index.upsert(async_req=True, **upsert_kwargs)
+                        pending.append((batch_no, future, upsert_kwargs))
+                        if len(pending) >= max_inflight:
+                            _resolve(*pending.popleft())
+                    except Exception as e:
+                        logger.error("Error at batch %d: %.200s", batch_no, e)
+                progress.update(len(chunk))
+        
+        # Wait for outstanding async upserts
+        for entry in pending:
+            _resolve(*entry)
+        progress.close()
         
         stats = self.index.describe_index_stats()
-        print(f"\n{'='*60}")
-        print(f"✅ Upload completed!")
-        print(f"📊 Successful: {successful_batches}/{total_batches}")
-        print(f"❌ Failed: {failed_batches}/{total_batches}")
-        print(f"📊 Total vectors: {stats['total_vector_count']}")
-        print(f"{'='*60}\n")
+        logger.info(
+            "Upload completed: %d/%d batches ok, %d failed, %d upsert retries, %d total vectors",
+            successful_batches, total_batches, total_batches - successful_batches,
+            total_retries, stats["total_vector_count"],
+        )
+        if self.failed_documents:
+            logger.warning(
+                "Documents not embedded (see self.failed_documents): %d",
+                len(self.failed_documents),
+            )
         
         return self
     
@@ -300,22 +857,24 @@ class Embedding:
         Returns:
             self (for chaining)
         """
-        if not self.index:
-            print(f"📦 Connecting to existing Pinecone index: {self.index_name}")
-            self.index = self.pc.Index(self.index_name)
+        if self._index is None:
+            logger.info("Connecting to existing Pinecone index: %s", self.index_name)
             
             # Verify index exists and get stats
             try:
                 stats = self.index.describe_index_stats()
-                print(f"✅ Index connected!")
-                print(f"   Total vectors: {stats['total_vector_count']}")
-                print(f"   Dimension: {stats.get('dimension', 'unknown')}")
+                logger.info(
+                    "Index connected (%s vectors, dimension %s)",
+                    stats["total_vector_count"], stats.get("dimension", "unknown"),
+                )
             except Exception as e:
-                print(f"⚠️ Warning: Could not get index stats: {e}")
+                logger.warning("Could not get index stats: %s", e)
         
         return self
 
-    def similarity_search(self, query, k=5, namespace="") -> List[Dict[str, Any]]:
+    # Similarity math runs inside Pinecone and vectors come back normalized from
+    # SentenceTransformer, so nothing here is worth JIT-compiling (see rerank_mmr.py)
+    def similarity_search(self, query, k=5, namespace="", query_embedding=None) -> List[Dict[str, Any]]:
         """
         Perform similarity search using direct Pinecone API
         
@@ -323,21 +882,60 @@ class Embedding:
             query: Search query
             k: Number of results
             namespace: Pinecone namespace
+            query_embedding: Precomputed embed_query(query), if the caller
+                already has it
         
         Returns:
             List of dicts with 'text', 'score', 'metadata'
         """
-        if not self.index:
-            self.index = self.pc.Index(self.index_name)
         
-        print(f"🔎 Searching top-{k} docs for: '{query[:50]}...'")
+        # Per-request hot path: lazy %-formatting, debug level
+        logger.debug("Searching top-%d docs for: '%.50s'", k, query)
         
         # Embed query
-        query_embedding = self.embed_model.embed_query(query)
-        
+        if query_embedding is None:
+            query_embedding = self.embed_query(query)
+        return self._query_index(query_embedding, k, namespace)
+
+    async def similarity_search_async(self, query, k=5, namespace="", query_embedding=None) -> List[Dict[str, Any]]:
+        """
+        Async similarity_search for event-loop callers
+
+        The query joins the shared micro-batch without blocking the loop;
+        the Pinecone query runs in the default executor.
+
+        Args:
+            query: Search query
+            k: Number of results
+            namespace: Pinecone namespace
+            query_embedding: Precomputed embed_query(query), if available
+
+        Returns:
+            List of dicts with 'text', 'score', 'metadata'
+        """
+        loop = asyncio.get_running_loop()
+
+        if query_embedding is None:
+            with self._query_cache_lock:
+                query_embedding = self._query_cache.get(query)
+        if query_embedding is None:
+            if self._query_batcher is None:
+                query_embedding = await loop.run_in_executor(None, self.embed_query, query)
+            else:
+                embedding = await asyncio.wrap_future(self._query_batcher.submit(query))
+                query_embedding = _as_query_vector(embedding)
+                with self._query_cache_lock:
+                    self._query_cache[query] = query_embedding
+
+        return await loop.run_in_executor(
+            None, self._query_index, query_embedding, k, namespace
+        )
+
+    def _query_index(self, query_embedding, k, namespace) -> List[Dict[str, Any]]:
+        """Run the Pinecone query for an embedded query and format the matches"""
         # Search params
         search_params = {
-            "vector": query_embedding,
+            "vector": query_embedding.tolist(),  # JSON boundary
             "top_k": k,
             "include_metadata": True
         }
@@ -358,6 +956,32 @@ class Embedding:
         
         return docs
 
+    def embed_query(self, query):
+        """
+        Embed a search query (LRU-cached per instance)
+
+        Local models go through the micro-batcher so concurrent requests are
+        encoded together; Google embeddings need task_type=retrieval_query
+        and are called directly.
+
+        Returns:
+            np.ndarray: Read-only float32 query embedding (shared via the cache)
+        """
+        with self._query_cache_lock:
+            embedding = self._query_cache.get(query)
+        if embedding is not None:
+            return embedding
+
+        if self._query_batcher is None:
+            embedding = self.embed_model.embed_query(query)
+        else:
+            embedding = self._query_batcher(query)
+        embedding = _as_query_vector(embedding)
+
+        with self._query_cache_lock:
+            self._query_cache[query] = embedding
+        return embedding
+
     def similarity_search_with_score(self, query, k=5, namespace=""):
         """Alias for similarity_search (returns same format)"""
         return self.similarity_search(query, k, namespace)
@@ -370,19 +994,22 @@ class Embedding:
             new_splits: New documents to add
             namespace: Pinecone namespace
         """
-        print(f"➕ Adding {len(new_splits)} new documents...")
+        logger.info("Adding %d new documents", len(new_splits))
         return self.create_embedding(new_splits, namespace=namespace)
 
     def delete_index(self):
         """Delete Pinecone index"""
-        print(f"🗑️ Deleting index '{self.index_name}'...")
+        logger.info("Deleting index '%s'", self.index_name)
         self.pc.delete_index(self.index_name)
-        print("✅ Index deleted!")
+        if self.ingest_cache is not None:
+            self.ingest_cache.forget(self.index_name)
+        self._index = None
+        self._upsert_index = None
+        self._index_ready = False
+        logger.info("Index deleted")
     
     def get_stats(self):
         """Get index statistics"""
-        if not self.index:
-            self.index = self.pc.Index(self.index_name)
         return self.index.describe_index_stats()
 
 
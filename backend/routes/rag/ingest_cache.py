@@ -0,0 +1,88 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+def document_id(text, metadata):
+    """
+    Deterministic vector id for a chunk: same content + source -> same id
+
+    Args:
+        text: Chunk text (page_content)
+        metadata: Chunk metadata (only 'source' is used)
+
+    Returns:
+        str: 24-hex-char id
+    """
+    key = text + str(metadata.get("source", ""))
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:24]
+
+
+class IngestCache:
+    """
+    Record of vector ids already upserted, per (index, namespace)
+
+    Lets create_embedding skip re-embedding and re-upserting unchanged
+    documents on re-ingestion. Ids are content hashes (see document_id),
+    so an edited chunk gets a new id and is ingested again.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: SQLite database file
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ingested (
+                    index_name TEXT NOT NULL,
+                    namespace TEXT NOT NULL,
+                    vid TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    PRIMARY KEY (index_name, namespace, vid)
+                )
+                """
+            )
+            self._conn.commit()
+
+    def existing(self, index_name, namespace, vids):
+        """Subset of vids already ingested into index_name/namespace"""
+        found = set()
+        vids = list(vids)
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(vids), 500):
+                batch = vids[i:i + 500]
+                rows = self._conn.execute(
+                    "SELECT vid FROM ingested WHERE index_name = ? AND namespace = ? "
+                    f"AND vid IN ({','.join('?' * len(batch))})",
+                    (index_name, namespace, *batch),
+                ).fetchall()
+                found.update(row[0] for row in rows)
+        return found
+
+    def add(self, index_name, namespace, vids):
+        """Mark vids as ingested (call only after a successful upsert)"""
+        ts = int(time.time())
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO ingested (index_name, namespace, vid, ts) "
+                "VALUES (?, ?, ?, ?)",
+                [(index_name, namespace, vid, ts) for vid in vids],
+            )
+            self._conn.commit()
+
+    def forget(self, index_name):
+        """Drop every record for an index (e.g. after delete_index)"""
+        with self._lock:
+            self._conn.execute("DELETE FROM ingested WHERE index_name = ?", (index_name,))
+            self._conn.commit()
@@ -0,0 +1,84 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import cachetools
+
+
+class LLMResponseCache:
+    """
+    Two-layer exact-match cache for LLM answers
+
+    - Layer 1: in-process LRU (sub-microsecond hits)
+    - Layer 2: SQLite file, so answers survive restarts and are shared by
+      every worker on the machine
+
+    Keys are sha256 of the full prompt, so the same question with different
+    retrieved context is a different entry.
+    """
+
+    def __init__(self, path, maxsize=10000, ttl_seconds=86400):
+        """
+        Args:
+            path: SQLite database file
+            maxsize: In-memory LRU capacity
+            ttl_seconds: Entry lifetime (both layers)
+        """
+        self.ttl_seconds = ttl_seconds
+        self._memory = cachetools.LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    qhash TEXT PRIMARY KEY,
+                    answer TEXT NOT NULL,
+                    ts INTEGER NOT NULL
+                )
+                """
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def key(prompt):
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    def get(self, prompt):
+        """Cached answer for a prompt, or None"""
+        qhash = self.key(prompt)
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(qhash)
+            if hit is not None:
+                answer, ts = hit
+                if now - ts < self.ttl_seconds:
+                    return answer
+                del self._memory[qhash]
+
+            row = self._conn.execute(
+                "SELECT answer, ts FROM llm_cache WHERE qhash = ?", (qhash,)
+            ).fetchone()
+            if row is None or now - row[1] >= self.ttl_seconds:
+                return None
+            self._memory[qhash] = (row[0], row[1])
+            return row[0]
+
+    def put(self, prompt, answer):
+        """Store an answer for a prompt"""
+        qhash = self.key(prompt)
+        ts = int(time.time())
+        with self._lock:
+            self._memory[qhash] = (answer, ts)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (qhash, answer, ts) VALUES (?, ?, ?)",
+                (qhash, answer, ts),
+            )
+            self._conn.commit()
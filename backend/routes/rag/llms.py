@@ -1,173 +1,323 @@
-# import os
-# from dotenv import load_dotenv
-# import google.generativeai as genai
-# from groq import Groq
-
-# try:
-#     from prompt import *
-# except ImportError:
-#     from .prompt import *
-
-# load_dotenv(".env")
-
-
-# class LLM:
-#     """
-#     LLM wrapper supporting:
-#     - Google Gemini
-#     - Groq (Llama, Mixtral, Gemma)
-#     """
-
-#     def __init__(self, google_api_key=None, groq_api_key=None,
-#                  temperature=0.4, model_name="groq/llama-3.3-70b-versatile",
-#                  language="vi"):
-#         """
-#         Initialize LLM
-
-#         Args:
-#             google_api_key: Google API key
-#             groq_api_key: Groq API key
-#             temperature: Temperature for generation (0-1)
-#             model_name: Model name with provider prefix:
-#                 - "models/gemini-2.0-flash" (Google)
-#                 - "groq/llama-3.3-70b-versatile" (Groq - BEST FREE)
-#                 - "groq/llama-3.1-8b-instant" (Groq - Fastest)
-#                 - "groq/mixtral-8x7b-32768" (Groq - Long context)
-#             language: 'vi' or 'en'
-#         """
-#         self.temperature = temperature
-#         self.model_name = model_name
-#         self.language = language.lower()
-
-#         # Determine provider
-#         if model_name.startswith("groq/"):
-#             self.provider = "groq"
-#             self.groq_api_key = groq_api_key or os.getenv("GROQ_API_KEY")
-#             if not self.groq_api_key:
-#                 raise ValueError("❌ GROQ_API_KEY is required!")
-
-#             self.client = Groq(api_key=self.groq_api_key)
-#             self.model_id = model_name.replace("groq/", "")
-#             print(f"✅ LLM initialized: Groq - {self.model_id}")
-
-#         else:  # Default to Gemini
-#             self.provider = "gemini"
-#             self.google_api_key = google_api_key or os.getenv("GOOGLE_API_KEY")
-#             if not self.google_api_key:
-#                 raise ValueError("❌ GOOGLE_API_KEY is required!")
-
-#             genai.configure(api_key=self.google_api_key)
-#             self.model = genai.GenerativeModel(
-#                 model_name=self.model_name,
-#                 generation_config=genai.GenerationConfig(
-#                     temperature=self.temperature,
-#                     max_output_tokens=4096,
-#                 )
-#             )
-#             print(f"✅ LLM initialized: Gemini - {self.model_name}")
-
-#         print(f"   Language: {self.language}")
-#         print(f"   Temperature: {self.temperature}")
-
-#     def preprocess_prompt(self, question: str, context: str = None) -> str:
-#         """Create prompt based on language and context"""
-#         if self.language == "en":
-#             if context:
-#                 user_message = USER_MESSAGE_WITH_CONTEXT_EN.format(
-#                     context=context, question=question
-#                 )
-#                 prompt = DEFAULT_PROMPT_EN.format(user_message=user_message)
-#             else:
-#                 prompt = DEFAULT_PROMPT_EN.format(user_message=question)
-#         else:  # Vietnamese
-#             if context:
-#                 user_message = USER_MESSAGE_WITH_CONTEXT_VN.format(
-#                     context=context, question=question
-#                 )
-#                 prompt = DEFAULT_PROMPT_VN.format(user_message=user_message)
-#             else:
-#                 prompt = DEFAULT_PROMPT_VN.format(user_message=question)
-#         return prompt
-
-#     def generate(self, prompt: str) -> str:
-#         """
-#         Generate response from LLM
-
-#         Args:
-#             prompt: Input prompt
-
-#         Returns:
-#             Generated text
-#         """
-#         try:
-#             if self.provider == "groq":
-#                 # Groq API
-#                 response = self.client.chat.completions.create(
-#                     model=self.model_id,
-#                     messages=[
-#                         {"role": "user", "content": prompt}
-#                     ],
-#                     temperature=self.temperature,
-#                     max_tokens=4096,
-#                 )
-#                 return response.choices[0].message.content
-
-#             else:  # Gemini
-#                 response = self.model.generate_content(prompt)
-#                 return response.text
-
-#         except Exception as e:
-#             error_msg = str(e)
-#             print(f"❌ Error generating response: {error_msg}")
-
-#             # Handle rate limits
-#             if "429" in error_msg or "quota" in error_msg.lower():
-#                 return "Xin lỗi, hệ thống đang quá tải. Vui lòng thử lại sau 1 phút."
-
-#             return "Xin lỗi, tôi đang gặp sự cố kỹ thuật. Vui lòng thử lại sau."
-
-#     def chat(self, question: str, context: str = None) -> str:
-#         """
-#         Convenience method for chat
-
-#         Args:
-#             question: User question
-#             context: Optional context
-
-#         Returns:
-#             Generated answer
-#         """
-#         prompt = self.preprocess_prompt(question, context)
-#         return self.generate(prompt)
-
-
-# # Test
-# if __name__ == "__main__":
-#     # Test Groq
-#     llm = LLM(model_name="groq/llama-3.1-70b-versatile", language="vi")
-#     response = llm.chat("Triệu chứng đau đầu và sốt có thể là bệnh gì?")
-#     print(response)
-
 import os
+import time
+import random
+import asyncio
+import hashlib
+import string
+import threading
+import cachetools
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import requests
-import json
+from urllib.parse import urlsplit, urlunsplit
+from requests.adapters import HTTPAdapter
+import orjson
+import aiohttp
 
 try:
     from prompt import *
 except ImportError:
     from .prompt import *
 
+try:
+    from llm_cache import LLMResponseCache
+except ImportError:
+    from .llm_cache import LLMResponseCache
+
 load_dotenv(".env")
 
+def _compile_prompt(template):
+    """
+    Split a template at its {fields} once, at import time
+
+    Rendering is a single join of constant literals and the field values,
+    so str.format never re-parses the (long, static) template per request.
+
+    Args:
+        template: Template with {question} and optionally {context}
+
+    Returns:
+        Callable (context=..., question=...) -> str
+    """
+    literals, fields = [""], []
+    for literal, field, _, _ in string.Formatter().parse(template):
+        literals[-1] += literal
+        if field is not None:
+            fields.append(field)
+            literals.append("")
+
+    if fields == ["question"]:
+        head, tail = literals
+        return lambda context=None, question="": "".join((head, question, tail))
+    if fields == ["context", "question"]:
+        head, middle, tail = literals
+        return lambda context="", question="": "".join(
+            (head, context, middle, question, tail)
+        )
+    raise ValueError(f"Unsupported prompt fields: {fields}")
+
+
+# Prompt builders keyed by (language, has_context): static prefix + dynamic
+# suffix in one template; all take context= and question=
+_PROMPT_FORMATTERS = {
+    ("en", False): _compile_prompt(SYSTEM_PREFIX_EN + USER_SUFFIX_EN),
+    ("en", True): _compile_prompt(RAG_PREFIX_EN + USER_SUFFIX_WITH_CONTEXT_EN),
+    ("vi", False): _compile_prompt(SYSTEM_PREFIX_VN + USER_SUFFIX_VN),
+    ("vi", True): _compile_prompt(RAG_PREFIX_VN + USER_SUFFIX_WITH_CONTEXT_VN),
+}
+
+# Replies returned instead of raising (callers show them to the user)
+ERROR_REPLY_PREFIX = "Xin lỗi"
+RATE_LIMIT_MSG = "Xin lỗi, hệ thống đang quá tải. Vui lòng thử lại sau 1 phút."
+GENERIC_ERR_MSG = "Xin lỗi, tôi đang gặp sự cố kỹ thuật. Vui lòng thử lại sau."
+TIMEOUT_MSG = "Xin lỗi, việc xử lý mất quá nhiều thời gian. Vui lòng thử lại."
+OLLAMA_DOWN_MSG = "Xin lỗi, không thể kết nối đến Ollama. Hãy chắc chắn Ollama đang chạy."
+
+# Provider errors that mean "throttled" (Gemini gRPC/HTTP, Ollama HTTP)
+_RATE_LIMIT_ERRORS = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+
+
+def _is_rate_limited(e) -> bool:
+    if isinstance(e, _RATE_LIMIT_ERRORS):
+        return True
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code == 429
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status == 429
+    return False
+
+
+# Throttling / server errors are retried inline with jittered backoff
+LLM_MAX_ATTEMPTS = 4
+LLM_MAX_BACKOFF_SECONDS = 8
+_SERVER_ERRORS = (
+    google_exceptions.InternalServerError,
+    google_exceptions.ServiceUnavailable,
+)
+
+
+def _is_retryable(e) -> bool:
+    if _is_rate_limited(e) or isinstance(e, _SERVER_ERRORS):
+        return True
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code >= 500
+    if isinstance(e, aiohttp.ClientResponseError):
+        return e.status >= 500
+    return False
+
+
+def _retry_delay(e, attempt) -> float:
+    """Server's Retry-After if given, else exponential backoff with jitter"""
+    headers = None
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        headers = e.response.headers
+    elif isinstance(e, aiohttp.ClientResponseError):
+        headers = e.headers
+    try:
+        return min(float(headers["Retry-After"]), 30.0)
+    except (TypeError, KeyError, ValueError):
+        return min(2 ** attempt + random.random(), LLM_MAX_BACKOFF_SECONDS)
+
+
+def _with_retries(call):
+    for attempt in range(LLM_MAX_ATTEMPTS):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == LLM_MAX_ATTEMPTS - 1 or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"🔁 LLM call throttled/failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+async def _awith_retries(call):
+    for attempt in range(LLM_MAX_ATTEMPTS):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt == LLM_MAX_ATTEMPTS - 1 or not _is_retryable(e):
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"🔁 LLM call throttled/failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def _error_reply(e) -> str:
+    """User-facing reply for a failed generation"""
+    return RATE_LIMIT_MSG if _is_rate_limited(e) else GENERIC_ERR_MSG
+
+
+# generate() answers are memoized only for (near-)deterministic sampling
+DETERMINISTIC_TEMPERATURE = 0.01
+
+# A truncated answer is regenerated once with this many times the token cap
+TRUNCATION_EXTEND_FACTOR = 4
+
+
+def is_truncated(response) -> bool:
+    """True if a Gemini response stopped because it hit max_output_tokens"""
+    try:
+        return response.candidates[0].finish_reason.name == "MAX_TOKENS"
+    except (AttributeError, IndexError):
+        return False
+
+
+# Keep-alive connection pool for Ollama calls (one TCP handshake per
+# connection instead of per request), shared by every LLM instance
+_HTTP = requests.Session()
+_HTTP_ADAPTER = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=0)
+_HTTP.mount("http://", _HTTP_ADAPTER)
+_HTTP.mount("https://", _HTTP_ADAPTER)
+
+def _loopback_url(url):
+    """
+    Point "localhost" URLs at 127.0.0.1
+
+    Ollama listens on IPv4 loopback only, while "localhost" often resolves
+    to ::1 first: every new connection would pay a resolver lookup plus a
+    refused IPv6 attempt before falling back. (Ollama has no Unix-socket
+    listener, so loopback TCP over the pooled Session is the local fast path.)
+    """
+    parts = urlsplit(url)
+    if parts.hostname != "localhost":
+        return url
+    netloc = "127.0.0.1" + (f":{parts.port}" if parts.port else "")
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Keep Ollama models resident between bursts (default eviction is 5 min idle)
+OLLAMA_KEEP_ALIVE = "30m"
+OLLAMA_PING_INTERVAL_SECONDS = 20 * 60
+_OLLAMA_PINGERS = set()  # (ollama_url, model_id) with a running keep-alive timer
+_OLLAMA_PINGERS_LOCK = threading.Lock()
+
+
+def _ollama_load(ollama_url, model_id, options=None):
+    """Load a model without generating (empty prompt) and pin it for OLLAMA_KEEP_ALIVE"""
+    body = {"model": model_id, "keep_alive": OLLAMA_KEEP_ALIVE}
+    if options:
+        # Same runner options as real requests, otherwise Ollama reloads the
+        # model on the first generate with a different num_ctx/num_gpu
+        body["options"] = options
+    try:
+        _HTTP.post(
+            f"{ollama_url}/api/generate",
+            data=orjson.dumps(body),
+            headers=_JSON_HEADERS,
+            timeout=120,
+        )
+    except Exception as e:
+        print(f"⚠️ Ollama keep-alive failed for {model_id}: {e}")
+
+
+def _ollama_keep_warm(ollama_url, model_id, options=None):
+    """Preload now, then re-pin every OLLAMA_PING_INTERVAL_SECONDS (once per model)"""
+    key = (ollama_url, model_id)
+    with _OLLAMA_PINGERS_LOCK:
+        if key in _OLLAMA_PINGERS:
+            return
+        _OLLAMA_PINGERS.add(key)
+
+    def _tick():
+        _ollama_load(ollama_url, model_id, options)
+        timer = threading.Timer(OLLAMA_PING_INTERVAL_SECONDS, _tick)
+        timer.daemon = True
+        timer.start()
+
+    # First load runs in the background so LLM() does not block on it
+    threading.Thread(target=_tick, name=f"ollama-keepalive-{model_id}", daemon=True).start()
+
+# GenerativeModel instances shared by every LLM with the same settings
+_GEMINI_MODELS = {}
+_GEMINI_LOCK = threading.Lock()
+_configured_api_key = None
+
+
+def _get_gemini_model(api_key, model_name, temperature, max_output_tokens, generation_config):
+    """
+    Process-wide GenerativeModel for a configuration
+
+    genai.configure() runs once per API key instead of once per LLM instance,
+    so the underlying client (and its connections) is reused.
+    """
+    global _configured_api_key
+    key = (
+        model_name,
+        temperature,
+        max_output_tokens,
+        tuple(sorted(generation_config.items())),
+    )
+    with _GEMINI_LOCK:
+        if _configured_api_key != api_key:
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+            _GEMINI_MODELS.clear()
+
+        model = _GEMINI_MODELS.get(key)
+        if model is None:
+            model = genai.GenerativeModel(
+                model_name=model_name,
+                generation_config=genai.GenerationConfig(
+                    temperature=temperature,
+                    max_output_tokens=max_output_tokens,
+                    **generation_config,
+                ),
+            )
+            _GEMINI_MODELS[key] = model
+        return model
+
+
+def _chunk_text(chunk):
+    """Text of a streamed Gemini chunk ("" for chunks without text parts)"""
+    try:
+        return chunk.text
+    except ValueError:
+        # e.g. the final chunk carrying only finish_reason
+        return ""
+
+
+# ==========================================
+# 🔌 Provider registry
+# ==========================================
+# One (sync, async) call per provider; LLM.__init__ picks the pair once so
+# the hot path does no provider branching.
+
+
+def _call_ollama(llm, prompt):
+    llm._ensure_connected()
+    return _with_retries(lambda: llm._ollama_generate(prompt))
+
+
+def _call_gemini(llm, prompt):
+    return _with_retries(lambda: llm.generate_content(prompt))
+
+
+async def _acall_ollama(llm, prompt):
+    if not llm._connected:
+        await asyncio.to_thread(llm._ensure_connected)
+    return await _awith_retries(lambda: llm._aollama_generate(prompt))
+
+
+async def _acall_gemini(llm, prompt):
+    return await _awith_retries(lambda: llm.agenerate_content(prompt))
+
+
+PROVIDERS = {
+    "ollama": (_call_ollama, _acall_ollama),
+    "gemini": (_call_gemini, _acall_gemini),
+}
+
 
 class LLM:
     """
     LLM wrapper supporting:
     - Google Gemini
     - Ollama (Local)
-    - Groq (Optional)
+    - Groq (removed; groq_api_key is ignored)
     """
 
     def __init__(
@@ -178,6 +328,14 @@ class LLM:
         model_name="models/gemini-2.0-flash",
         ollama_url="http://localhost:11434",
         language="vi",
+        max_output_tokens=4096,
+        generation_config=None,
+        cache_path=None,
+        semantic_cache=None,
+        num_ctx=4096,
+        num_batch=512,
+        num_thread=None,
+        num_gpu=None,
     ):
         """
         Initialize LLM
@@ -193,38 +351,60 @@ class LLM:
                 - "models/gemini-2.0-flash" (Google Cloud)
             ollama_url: Ollama API endpoint (default: http://localhost:11434)
             language: 'vi' or 'en'
+            max_output_tokens: Cap on generated tokens (output length drives latency)
+            generation_config: Extra Gemini generation options
+                (e.g. {"top_p": 0.9, "candidate_count": 1})
+            cache_path: SQLite file for the chat() answer cache (None = no cache)
+            semantic_cache: Optional SemanticCache (encode/lookup/add) serving
+                chat() answers for paraphrased questions with the same context
+            num_ctx: Ollama context window (KV cache size; RAG prompts fit in 4096)
+            num_batch: Ollama prompt-processing batch size (prefill throughput)
+            num_thread: Ollama CPU threads (None = os.cpu_count())
+            num_gpu: Ollama layers offloaded to GPU (None = Ollama decides)
         """
         self.temperature = temperature
         self.model_name = model_name
         self.language = language.lower()
-        self.ollama_url = ollama_url
+        prompt_language = "en" if self.language == "en" else "vi"  # Default: Vietnamese
+        self._prompt_fns = (
+            _PROMPT_FORMATTERS[(prompt_language, False)],
+            _PROMPT_FORMATTERS[(prompt_language, True)],
+        )
+        self.ollama_url = _loopback_url(ollama_url)
+        self.max_output_tokens = max_output_tokens
+        self.generation_config = dict(generation_config or {})
+        self.cache = LLMResponseCache(cache_path) if cache_path else None
+        self.semantic_cache = semantic_cache
+        self._aio = None  # aiohttp session for agenerate (Ollama), per event loop
+        self._aio_loop = None
+
+        # Exact-prompt memo for generate()/agenerate() at temperature ~0
+        self._responses = cachetools.TTLCache(maxsize=1024, ttl=3600)
+        self._responses_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
 
         # Determine provider
         if model_name.startswith("ollama/"):
             self.provider = "ollama"
             self.model_id = model_name.replace("ollama/", "")
 
-            # Test Ollama connection
-            try:
-                response = requests.get(f"{self.ollama_url}/api/tags", timeout=5)
-                if response.status_code == 200:
-                    available_models = [
-                        m["name"] for m in response.json().get("models", [])
-                    ]
-                    print(
-                        f"✅ Ollama connected! Available: {', '.join(available_models[:3])}..."
-                    )
-
-                    if self.model_id not in available_models:
-                        print(f"⚠️ Model '{self.model_id}' not found.")
-                        print(f"   Run: ollama pull {self.model_id}")
-                else:
-                    raise Exception(f"Ollama returned status {response.status_code}")
-            except Exception as e:
-                print(f"❌ Cannot connect to Ollama at {self.ollama_url}")
-                print(f"   Error: {e}")
-                print(f"   Make sure Ollama is running: ollama serve")
-                raise ValueError("Ollama connection failed!")
+            # Connection is tested on first use (_ensure_connected), so
+            # constructing an LLM costs no round-trip
+            self._connected = False
+
+            self._ollama_options = {
+                "temperature": self.temperature,
+                "num_predict": self.max_output_tokens,
+                "num_ctx": num_ctx,
+                "num_batch": num_batch,
+                "num_thread": num_thread or os.cpu_count(),
+            }
+            if num_gpu is not None:
+                self._ollama_options["num_gpu"] = num_gpu
+
+            # Pay the model load once at startup, not on the first request
+            _ollama_keep_warm(self.ollama_url, self.model_id, self._ollama_options)
 
             # ✅ FIX: Print đúng provider
             print(f"✅ LLM initialized - {self.model_id}")
@@ -235,102 +415,189 @@ class LLM:
             if not self.google_api_key:
                 raise ValueError("❌ GOOGLE_API_KEY is required!")
 
-            genai.configure(api_key=self.google_api_key)
-            self.model = genai.GenerativeModel(
-                model_name=self.model_name,
-                generation_config=genai.GenerationConfig(
-                    temperature=self.temperature,
-                    max_output_tokens=4096,
-                ),
+            self.model = _get_gemini_model(
+                self.google_api_key,
+                self.model_name,
+                self.temperature,
+                self.max_output_tokens,
+                self.generation_config,
+            )
+            # Built once: the truncation retry reuses it instead of passing
+            # (and the SDK re-validating) a fresh dict on every call
+            self._extended_gen_cfg = genai.GenerationConfig(
+                temperature=self.temperature,
+                max_output_tokens=self.max_output_tokens * TRUNCATION_EXTEND_FACTOR,
+                **self.generation_config,
             )
             # ✅ FIX: Print đúng provider
             print(f"✅ LLM initialized: Gemini - {self.model_name}")
 
+        self._call, self._acall = PROVIDERS[self.provider]
+
         print(f"   Language: {self.language}")
         print(f"   Temperature: {self.temperature}")
 
     def preprocess_prompt(self, question: str, context: str = None) -> str:
         """Create prompt based on language and context"""
-        if self.language == "en":
-            if context:
-                user_message = USER_MESSAGE_WITH_CONTEXT_EN.format(
-                    context=context, question=question
+        return self._prompt_fns[bool(context)](context=context, question=question)
+
+    def _ensure_connected(self):
+        """
+        Test the Ollama connection once, before the first request
+
+        Raises:
+            ValueError: Ollama is not reachable (retried on the next call)
+        """
+        if self._connected:
+            return
+        try:
+            response = _HTTP.get(f"{self.ollama_url}/api/tags", timeout=5)
+            if response.status_code == 200:
+                available_models = [
+                    m["name"] for m in response.json().get("models", [])
+                ]
+                print(
+                    f"✅ Ollama connected! Available: {', '.join(available_models[:3])}..."
                 )
-                prompt = DEFAULT_PROMPT_EN.format(user_message=user_message)
+
+                if self.model_id not in available_models:
+                    print(f"⚠️ Model '{self.model_id}' not found.")
+                    print(f"   Run: ollama pull {self.model_id}")
             else:
-                prompt = DEFAULT_PROMPT_EN.format(user_message=question)
-        else:  # Vietnamese
-            if context:
-                user_message = USER_MESSAGE_WITH_CONTEXT_VN.format(
-                    context=context, question=question
-                )
-                prompt = DEFAULT_PROMPT_VN.format(user_message=user_message)
+                raise Exception(f"Ollama returned status {response.status_code}")
+        except Exception as e:
+            print(f"❌ Cannot connect to Ollama at {self.ollama_url}")
+            print(f"   Error: {e}")
+            print(f"   Make sure Ollama is running: ollama serve")
+            raise ValueError("Ollama connection failed!")
+        self._connected = True
+
+    def _ollama_body(self, prompt, stream):
+        """
+        Serialized request body for Ollama /api/generate
+
+        orjson instead of requests/aiohttp's stdlib json.dumps: the prompt
+        (RAG context included) is several KB and is encoded on every call.
+        """
+        return orjson.dumps({
+            "model": self.model_id,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": self._ollama_options,
+        })
+
+    def _response_key(self, prompt):
+        """Memo key for a prompt, or None when sampling is not deterministic"""
+        if self.temperature > DETERMINISTIC_TEMPERATURE:
+            return None
+        key = f"{self.model_name}|{self.temperature}|{prompt}"
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+    def _memo_get(self, key):
+        if key is None:
+            return None
+        with self._responses_lock:
+            answer = self._responses.get(key)
+            if answer is None:
+                self._misses += 1
             else:
-                prompt = DEFAULT_PROMPT_VN.format(user_message=question)
-        return prompt
+                self._hits += 1
+            return answer
+
+    def _memo_put(self, key, answer):
+        # Apology strings are error replies, never memoize them
+        if key is None or not answer or answer.startswith(ERROR_REPLY_PREFIX):
+            return
+        with self._responses_lock:
+            self._responses[key] = answer
 
     def generate(self, prompt: str) -> str:
         """
         Generate response from LLM
 
+        At temperature <= DETERMINISTIC_TEMPERATURE identical prompts are
+        answered from an in-process TTL cache (1h).
+
         Args:
             prompt: Input prompt
 
         Returns:
             Generated text
         """
+        key = self._response_key(prompt)
+        answer = self._memo_get(key)
+        if answer is None:
+            answer = self._generate(prompt)
+            self._memo_put(key, answer)
+        return answer
+
+    def _generate(self, prompt: str) -> str:
+        """Uncached generate()"""
         try:
-            if self.provider == "ollama":
-                # Ollama API
-                response = requests.post(
-                    f"{self.ollama_url}/api/generate",
-                    json={
-                        "model": self.model_id,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": {
-                            "temperature": self.temperature,
-                            "num_predict": 4096,
-                        },
-                    },
-                    timeout=120,  # 2 minutes timeout for local generation
-                )
-
-                if response.status_code == 200:
-                    result = response.json()
-                    return result.get("response", "").strip()
-                else:
-                    error_msg = f"Ollama returned status {response.status_code}"
-                    print(f"❌ {error_msg}")
-                    return "Xin lỗi, tôi đang gặp sự cố kỹ thuật. Vui lòng thử lại sau."
-
-            else:  # Gemini
-                response = self.model.generate_content(prompt)
-                return response.text
+            return self._call(self, prompt)
 
         except requests.exceptions.Timeout:
             print("❌ Ollama request timeout")
-            return "Xin lỗi, việc xử lý mất quá nhiều thời gian. Vui lòng thử lại."
+            return TIMEOUT_MSG
 
         except requests.exceptions.ConnectionError:
             print("❌ Cannot connect to Ollama")
-            return (
-                "Xin lỗi, không thể kết nối đến Ollama. Hãy chắc chắn Ollama đang chạy."
-            )
+            return OLLAMA_DOWN_MSG
 
         except Exception as e:
-            error_msg = str(e)
-            print(f"❌ Error generating response: {error_msg}")
+            print(f"❌ Error generating response: {e}")
+            return _error_reply(e)
+
+    def _ollama_generate(self, prompt):
+        """
+        One Ollama /api/generate call
+
+        Raises:
+            requests.HTTPError: 429/5xx (retryable)
+        """
+        response = _HTTP.post(
+            f"{self.ollama_url}/api/generate",
+            data=self._ollama_body(prompt, stream=False),
+            headers=_JSON_HEADERS,
+            timeout=120,  # 2 minutes timeout for local generation
+        )
+
+        if response.status_code == 200:
+            result = response.json()
+            return result.get("response", "").strip()
+        print(f"❌ Ollama returned status {response.status_code}")
+        if response.status_code == 429 or response.status_code >= 500:
+            raise requests.HTTPError(response=response)
+        return GENERIC_ERR_MSG
+
+    def generate_content(self, prompt, model=None) -> str:
+        """
+        Call Gemini, regenerating once with a larger cap if the answer was cut off
 
-            # Handle rate limits
-            if "429" in error_msg or "quota" in error_msg.lower():
-                return "Xin lỗi, hệ thống đang quá tải. Vui lòng thử lại sau 1 phút."
+        Args:
+            prompt: Input prompt
+            model: GenerativeModel to use (default: self.model; e.g. a model
+                bound to cached content)
 
-            return "Xin lỗi, tôi đang gặp sự cố kỹ thuật. Vui lòng thử lại sau."
+        Returns:
+            Generated text
+
+        Raises:
+            Exception: API errors are propagated (generate() handles them)
+        """
+        model = model or self.model
+        response = model.generate_content(prompt)
+        if is_truncated(response):
+            response = model.generate_content(
+                prompt,
+                generation_config=self._extended_gen_cfg,
+            )
+        return response.text
 
     def chat(self, question: str, context: str = None) -> str:
         """
-        Convenience method for chat
+        Convenience method for chat (answers cached when cache_path is set)
 
         Args:
             question: User question
@@ -339,12 +606,227 @@ class LLM:
         Returns:
             Generated answer
         """
-        prompt = self.preprocess_prompt(question, context)
-        return self.generate(prompt)
+        # Same as preprocess_prompt(), without the extra call per request
+        prompt = self._prompt_fns[bool(context)](context=context, question=question)
+
+        # L1: exact prompt
+        cache_key = self._cache_key(prompt)
+        if self.cache is not None:
+            answer = self.cache.get(cache_key)
+            if answer is not None:
+                return answer
+
+        # L2: paraphrased question, same retrieved context
+        context_hash = self._context_hash(context)
+        vec = None
+        if self.semantic_cache is not None:
+            vec = self.semantic_cache.encode(question)
+            answer = self._semantic_lookup(vec, context_hash)
+            if answer is not None:
+                return answer
+
+        answer = self.generate(prompt)
+        self._store_answer(cache_key, vec, context_hash, answer)
+        return answer
+
+    def _cache_key(self, prompt):
+        # Same prompt under a different model/temperature is a different answer
+        return f"{self.model_name}|{self.temperature}|{prompt}"
+
+    @staticmethod
+    def _context_hash(context):
+        return hashlib.sha1((context or "").encode("utf-8")).hexdigest()
+
+    def _semantic_lookup(self, vec, context_hash):
+        """Cached answer for a similar question, only if the context matched"""
+        hit = self.semantic_cache.lookup(vec)
+        if hit is not None and hit[0] == context_hash:
+            return hit[1]
+        return None
+
+    def _store_answer(self, cache_key, vec, context_hash, answer):
+        # generate() returns an apology instead of raising; never cache those
+        if not answer or answer.startswith(ERROR_REPLY_PREFIX):
+            return
+        if self.cache is not None:
+            self.cache.put(cache_key, answer)
+        if vec is not None:
+            self.semantic_cache.add(vec, (context_hash, answer))
+
+    # ==========================================
+    # Async API (does not hold a worker thread while waiting on the model)
+    # ==========================================
+    def _aio_session(self):
+        """
+        aiohttp session for Ollama, created lazily per event loop
+        (a ClientSession cannot be shared across loops)
+        """
+        loop = asyncio.get_running_loop()
+        if self._aio is None or self._aio.closed or self._aio_loop is not loop:
+            self._close_stale_aio()
+            self._aio = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=32, limit_per_host=16, keepalive_timeout=60
+                )
+            )
+            self._aio_loop = loop
+        return self._aio
+
+    def _close_stale_aio(self):
+        """Close the session left behind by a previous event loop"""
+        session, loop = self._aio, self._aio_loop
+        self._aio = self._aio_loop = None
+        if session is None or session.closed:
+            return
+        if loop is not None and loop.is_running():
+            # Still serving another thread: close it on its own loop
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        # Loop is stopped or closed (e.g. after asyncio.run), so the close
+        # cannot be awaited there; release the pooled sockets directly
+        connector = session.connector
+        session.detach()
+        if connector is not None:
+            connector.close()
+
+    async def aclose(self):
+        """
+        Close the aiohttp session
+
+        Call before the event loop shuts down, e.g. at the end of the
+        coroutine passed to asyncio.run, to avoid "Unclosed client session".
+        """
+        if self._aio is not None and self._aio_loop is asyncio.get_running_loop():
+            session, self._aio, self._aio_loop = self._aio, None, None
+            if not session.closed:
+                await session.close()
+        else:
+            self._close_stale_aio()
+
+    async def agenerate(self, prompt: str) -> str:
+        """
+        Async variant of generate (same return values, error replies and cache)
+
+        Args:
+            prompt: Input prompt
+
+        Returns:
+            Generated text
+        """
+        key = self._response_key(prompt)
+        answer = self._memo_get(key)
+        if answer is None:
+            answer = await self._agenerate(prompt)
+            self._memo_put(key, answer)
+        return answer
+
+    async def _agenerate(self, prompt: str) -> str:
+        """Uncached agenerate()"""
+        try:
+            return await self._acall(self, prompt)
+
+        except asyncio.TimeoutError:
+            print("❌ Ollama request timeout")
+            return TIMEOUT_MSG
+
+        except aiohttp.ClientConnectionError:
+            print("❌ Cannot connect to Ollama")
+            return OLLAMA_DOWN_MSG
+
+        except Exception as e:
+            print(f"❌ Error generating response: {e}")
+            return _error_reply(e)
+
+    async def _aollama_generate(self, prompt):
+        """Async _ollama_generate (raises aiohttp.ClientResponseError on 429/5xx)"""
+        async with self._aio_session().post(
+            f"{self.ollama_url}/api/generate",
+            data=self._ollama_body(prompt, stream=False),
+            headers=_JSON_HEADERS,
+            timeout=aiohttp.ClientTimeout(total=120),
+        ) as response:
+            if response.status == 200:
+                result = await response.json()
+                return result.get("response", "").strip()
+            print(f"❌ Ollama returned status {response.status}")
+            if response.status == 429 or response.status >= 500:
+                raise aiohttp.ClientResponseError(
+                    response.request_info,
+                    response.history,
+                    status=response.status,
+                    headers=response.headers,
+                )
+            return GENERIC_ERR_MSG
+
+    async def agenerate_content(self, prompt, model=None) -> str:
+        """Async variant of generate_content (same truncation handling)"""
+        model = model or self.model
+        response = await model.generate_content_async(prompt)
+        if is_truncated(response):
+            response = await model.generate_content_async(
+                prompt,
+                generation_config=self._extended_gen_cfg,
+            )
+        return response.text
+
+    async def achat(self, question: str, context: str = None) -> str:
+        """
+        Async variant of chat (shares its answer cache)
+
+        Args:
+            question: User question
+            context: Optional context
+
+        Returns:
+            Generated answer
+        """
+        prompt = self._prompt_fns[bool(context)](context=context, question=question)
+
+        cache_key = self._cache_key(prompt)
+        if self.cache is not None:
+            answer = self.cache.get(cache_key)
+            if answer is not None:
+                return answer
+
+        context_hash = self._context_hash(context)
+        vec = None
+        if self.semantic_cache is not None:
+            # Embedding is CPU/GPU work; keep it off the event loop
+            vec = await asyncio.to_thread(self.semantic_cache.encode, question)
+            answer = self._semantic_lookup(vec, context_hash)
+            if answer is not None:
+                return answer
+
+        answer = await self.agenerate(prompt)
+        self._store_answer(cache_key, vec, context_hash, answer)
+        return answer
+
+    async def abatch_chat(self, items, concurrency=16):
+        """
+        Answer many (question, context) pairs concurrently
+
+        Args:
+            items: List of (question, context) tuples (context may be None)
+            concurrency: Maximum in-flight requests (keeps under provider
+                rate limits; retries handle the occasional 429)
+
+        Returns:
+            list[str]: Answers in the same order as items
+
+        Scripts driving this with asyncio.run should await aclose() before
+        returning, so the Ollama connection pool is closed on its own loop.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _one(question, context):
+            async with semaphore:
+                return await self.achat(question, context)
+
+        return await asyncio.gather(*(_one(q, c) for q, c in items))
 
     def generate_stream(self, prompt: str):
         """
-        Generate response with streaming (only for Ollama)
+        Generate response with streaming
 
         Args:
             prompt: Input prompt
@@ -353,38 +835,109 @@ class LLM:
             Text chunks
         """
         if self.provider != "ollama":
-            # Fallback to non-streaming for other providers
-            yield self.generate(prompt)
+            yield from self._generate_stream_gemini(prompt)
             return
 
         try:
-            response = requests.post(
+            self._ensure_connected()
+            response = _HTTP.post(
                 f"{self.ollama_url}/api/generate",
-                json={
-                    "model": self.model_id,
-                    "prompt": prompt,
-                    "stream": True,
-                    "options": {
-                        "temperature": self.temperature,
-                        "num_predict": 4096,
-                    },
-                },
+                data=self._ollama_body(prompt, stream=True),
+                headers=_JSON_HEADERS,
                 stream=True,
                 timeout=120,
             )
 
             if response.status_code == 200:
-                for line in response.iter_lines():
+                # Raw bytes straight into orjson: no per-line str decode
+                for line in response.iter_lines(chunk_size=4096, decode_unicode=False):
                     if line:
                         try:
-                            chunk = json.loads(line)
-                            if "response" in chunk:
-                                yield chunk["response"]
-                        except json.JSONDecodeError:
+                            chunk = orjson.loads(line)
+                        except orjson.JSONDecodeError:
                             continue
+                        text = chunk.get("response")
+                        if text:
+                            yield text
+            else:
+                yield GENERIC_ERR_MSG
+
+        except Exception as e:
+            print(f"❌ Streaming error: {e}")
+            yield _error_reply(e)
+
+    def _generate_stream_gemini(self, prompt: str):
+        """
+        Stream Gemini chunks as they arrive (first token in ~200ms instead of
+        waiting for the whole answer)
+
+        No truncation re-generation here: chunks are already on the wire.
+        Callers that need the complete text use generate().
+        """
+        started = False
+        try:
+            for chunk in self.model.generate_content(prompt, stream=True):
+                text = _chunk_text(chunk)
+                if text:
+                    started = True
+                    yield text
+
+        except Exception as e:
+            print(f"❌ Streaming error: {e}")
+            if not started:
+                # Nothing sent yet: the one-shot path can still answer
+                yield self.generate(prompt)
             else:
-                yield "Xin lỗi, tôi đang gặp sự cố kỹ thuật."
+                yield _error_reply(e)
+
+    async def agenerate_stream(self, prompt: str):
+        """
+        Async variant of generate_stream
+
+        Args:
+            prompt: Input prompt
+
+        Yields:
+            Text chunks
+        """
+        started = False
+        try:
+            if self.provider == "ollama":
+                if not self._connected:
+                    await asyncio.to_thread(self._ensure_connected)
+                async with self._aio_session().post(
+                    f"{self.ollama_url}/api/generate",
+                    data=self._ollama_body(prompt, stream=True),
+                    headers=_JSON_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=120),
+                ) as response:
+                    if response.status != 200:
+                        yield GENERIC_ERR_MSG
+                        return
+                    async for line in response.content:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            chunk = orjson.loads(line)
+                        except orjson.JSONDecodeError:
+                            continue
+                        text = chunk.get("response")
+                        if text:
+                            started = True
+                            yield text
+                return
+
+            response = await self.model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                text = _chunk_text(chunk)
+                if text:
+                    started = True
+                    yield text
 
         except Exception as e:
             print(f"❌ Streaming error: {e}")
-            yield "Xin lỗi, tôi đang gặp sự cố kỹ thuật."
+            if not started:
+                yield await self.agenerate(prompt)
+            else:
+                yield _error_reply(e)
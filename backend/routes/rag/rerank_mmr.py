@@ -0,0 +1,84 @@
+import numpy as np
+
+# Numba is optional: without it the same code runs as plain Python/NumPy
+try:
+    from numba import njit, prange
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda fn: fn
+
+    prange = range
+
+
+# ==========================================
+# 🔀 MMR Diversification (CPU-side)
+# ==========================================
+# Not wired into the pipeline yet. Retrieval today is dominated by I/O
+# (Pinecone, Gemini, reranker forward pass) and the embeddings are already
+# normalized by SentenceTransformer, so there is no Python numeric loop to
+# JIT. If MMR re-selection over the candidate vectors is added, this is the
+# kernel to call: cache=True keeps the compiled code on disk so workers do
+# not pay the compile cost on their first request.
+
+
+@njit(parallel=True, cache=True)
+def _cosine_to_query(doc_vecs, query_vec):
+    n = doc_vecs.shape[0]
+    sims = np.empty(n, dtype=np.float32)
+    for i in prange(n):
+        sims[i] = np.dot(doc_vecs[i], query_vec)
+    return sims
+
+
+@njit(cache=True)
+def _mmr_select(doc_vecs, query_sims, k, lambda_mult):
+    n = doc_vecs.shape[0]
+    selected = np.empty(k, dtype=np.int64)
+    chosen = np.zeros(n, dtype=np.bool_)
+    # max similarity of each candidate to anything already selected
+    max_sim = np.full(n, -np.inf, dtype=np.float32)
+
+    for step in range(k):
+        best = -1
+        best_score = -np.inf
+        for i in range(n):
+            if chosen[i]:
+                continue
+            redundancy = max_sim[i] if step > 0 else 0.0
+            score = lambda_mult * query_sims[i] - (1.0 - lambda_mult) * redundancy
+            if score > best_score:
+                best_score = score
+                best = i
+        selected[step] = best
+        chosen[best] = True
+        for i in range(n):
+            if not chosen[i]:
+                sim = np.dot(doc_vecs[i], doc_vecs[best])
+                if sim > max_sim[i]:
+                    max_sim[i] = sim
+    return selected
+
+
+def mmr_select(query_vec, doc_vecs, k=5, lambda_mult=0.7):
+    """
+    Maximal Marginal Relevance selection over candidate embeddings
+
+    Args:
+        query_vec: (D,) L2-normalized query embedding
+        doc_vecs: (N, D) L2-normalized candidate embeddings
+        k: Number of documents to select
+        lambda_mult: 1.0 = pure relevance, 0.0 = pure diversity
+
+    Returns:
+        list[int]: Indices into doc_vecs, in selection order
+    """
+    doc_vecs = np.ascontiguousarray(doc_vecs, dtype=np.float32)
+    query_vec = np.ascontiguousarray(query_vec, dtype=np.float32)
+    k = min(k, doc_vecs.shape[0])
+    if k == 0:
+        return []
+
+    query_sims = _cosine_to_query(doc_vecs, query_vec)
+    return _mmr_select(doc_vecs, query_sims, k, np.float32(lambda_mult)).tolist()
@@ -1,78 +1,87 @@
-# import os
-# from FlagEmbedding import FlagReranker
-# from dotenv import load_dotenv
-# import cohere
-
-# load_dotenv(".env")
-
-# class Reranker:
-#     """
-#     A unified reranker class supporting both BAAI and Cohere models.
-#     Used to reorder retrieved medical passages based on their relevance
-#     to the user's symptom-based question or query.
-#     """
-
-#     def __init__(self, model_name="BAAI/bge-reranker-v2-m3", top_n=5):
-#         self.model_name = model_name
-#         self.top_n = top_n
-
-#         cohere_api_key = os.getenv("COHERE_API_KEY")
-
-#         # Initialize reranker based on model type
-#         if self.model_name.lower().startswith("cohere"):
-#             if not cohere_api_key:
-#                 raise ValueError("❌ COHERE_API_KEY not found in .env file.")
-#             self.reranker = cohere.Client(cohere_api_key)
-#             self.backend = "cohere"
-#         else:
-#             # Default to BAAI reranker
-#             self.reranker = FlagReranker(model_name, use_fp16=True)
-#             self.backend = "baai"
-
-#     def rerank(self, query: str, passages: list[str]) -> list[str]:
-#         """
-#         Rerank retrieved documents by semantic relevance.
-
-#         Args:
-#             query (str): The user question or symptom description.
-#             passages (list[str]): List of retrieved medical passages.
-
-#         Returns:
-#             list[str]: Passages reordered by relevance score.
-#         """
-#         if not passages:
-#             return []
-
-#         if self.backend == "cohere":
-#             results = self.reranker.rerank(
-#                 query=query,
-#                 documents=passages,
-#                 top_n=min(self.top_n, len(passages)),
-#                 model="rerank-multilingual-v3.0"
-#             ).results
-#             reranked_passages = [passages[result.index] for result in results]
-#             scores = [result.relevance_score for result in results]
-
-#         else:  # BAAI reranker
-#             scores = self.reranker.compute_score(
-#                 [[query, passage] for passage in passages],
-#                 normalize=True
-#             )
-#             # Sort descending by score
-#             reranked_pairs = sorted(zip(scores, passages), key=lambda x: x[0], reverse=True)
-#             reranked_passages = [p for _, p in reranked_pairs[:self.top_n]]
-
-#         print(f"[RERANK] Query: {query}")
-#         print(f"[RERANK] Scores: {scores[:self.top_n]}")
-#         return reranked_passages
-
+import hashlib
+import importlib.util
 import os
+import threading
+import cachetools
+import numpy as np
+import torch
 from FlagEmbedding import FlagReranker
 from dotenv import load_dotenv
 import cohere
 
 load_dotenv(".env")
 
+# Let the fast tokenizer use every core when the first rerank() loads it
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "true")
+
+# Where the exported + INT8-quantized reranker is cached (backend="onnx")
+ONNX_RERANKER_DIR = "./models/bge-reranker-v2-m3-int8-onnx"
+ONNX_QUANTIZED_FILE = "model_quantized.onnx"
+
+
+def _load_onnx_reranker(model_name, cache_dir=ONNX_RERANKER_DIR):
+    """
+    ONNX Runtime session + tokenizer for a cross-encoder, INT8-quantized
+
+    The first call exports the model with optimum and applies dynamic INT8
+    quantization (AVX512-VNNI kernels on CPU); later calls load the cached
+    file. optimum / onnxruntime are only needed for this backend.
+
+    Returns:
+        tuple: (onnxruntime.InferenceSession, tokenizer)
+    """
+    import onnxruntime as ort
+    from transformers import AutoTokenizer
+
+    model_path = os.path.join(cache_dir, ONNX_QUANTIZED_FILE)
+    if not os.path.exists(model_path):
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+        print(f"🔄 Exporting {model_name} to ONNX (INT8)...")
+        model = ORTModelForSequenceClassification.from_pretrained(
+            model_name, export=True, provider="CPUExecutionProvider"
+        )
+        quantizer = ORTQuantizer.from_pretrained(model)
+        quantizer.quantize(
+            save_dir=cache_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(
+                is_static=False, per_channel=False
+            ),
+        )
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(cache_dir)
+        print(f"✅ Quantized reranker saved to {cache_dir}")
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    session = ort.InferenceSession(
+        model_path, sess_options=options, providers=["CPUExecutionProvider"]
+    )
+    return session, AutoTokenizer.from_pretrained(cache_dir)
+
+
+def _onnx_available(cache_dir=ONNX_RERANKER_DIR):
+    """onnxruntime is installed and the INT8 model is cached or can be exported"""
+    if importlib.util.find_spec("onnxruntime") is None:
+        return False
+    if os.path.exists(os.path.join(cache_dir, ONNX_QUANTIZED_FILE)):
+        return True
+    return importlib.util.find_spec("optimum") is not None
+
+
+def _resolve_dtype(dtype, device):
+    """
+    torch dtype for the BAAI reranker weights
+
+    bfloat16 has float32's exponent range, so unlike float16 it cannot
+    overflow in attention softmax; it needs Ampere or newer.
+    """
+    if device != "cuda":
+        return torch.float32
+    if dtype == "auto":
+        return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+    return getattr(torch, dtype)
+
 
 class Reranker:
     """
@@ -83,28 +92,76 @@ class Reranker:
     ✅ TUNED: Added threshold filtering for better precision
     """
 
-    def __init__(self, model_name="BAAI/bge-reranker-v2-m3", top_n=5):
+    def __init__(
+        self,
+        model_name="BAAI/bge-reranker-v2-m3",
+        top_n=5,
+        backend=None,
+        batch_size=32,
+        max_length=512,
+        dtype="auto",
+    ):
+        """
+        Args:
+            model_name: "cohere..." or a BAAI cross-encoder name
+            top_n: Number of passages to keep
+            backend: For BAAI models, "onnx" runs an INT8 ONNX Runtime export
+                on CPU; "auto" picks it on hosts without CUDA when
+                onnxruntime is available; anything else uses FlagReranker (PyTorch)
+            batch_size: Pairs per forward pass (BAAI models)
+            max_length: Token cap per (query, passage) pair (model limit: 512)
+            dtype: BAAI weights dtype on GPU: "auto" (bfloat16 where supported,
+                else float16), "bfloat16", "float16" or "float32"; CPU is float32
+        """
         self.model_name = model_name
         self.top_n = top_n
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+        # (query digest, passage digest) -> score; the same passages keep
+        # coming back for follow-up questions and paraphrases
+        self._scores = cachetools.TTLCache(maxsize=4096, ttl=900)
+        self._scores_lock = threading.Lock()
 
         cohere_api_key = os.getenv("COHERE_API_KEY")
 
+        if backend == "auto":
+            backend = "torch" if torch.cuda.is_available() or not _onnx_available() else "onnx"
+
         # Initialize reranker based on model type
         if self.model_name.lower().startswith("cohere"):
             if not cohere_api_key:
                 raise ValueError("❌ COHERE_API_KEY not found in .env file.")
-            self.reranker = cohere.Client(cohere_api_key)
+            self._reranker = cohere.Client(cohere_api_key)
             self.backend = "cohere"
+        elif backend == "onnx":
+            self.session, self.tokenizer = _load_onnx_reranker(model_name)
+            self._onnx_inputs = [i.name for i in self.session.get_inputs()]
+            self.backend = "onnx"
         else:
-            # Default to BAAI reranker with FP16 fallback
-            try:
-                self.reranker = FlagReranker(model_name, use_fp16=True)
-                self.backend = "baai"
-            except Exception as e:
-                print(f"⚠️ FP16 initialization failed: {e}")
-                print("   Falling back to FP32...")
-                self.reranker = FlagReranker(model_name, use_fp16=False)
-                self.backend = "baai"
+            # Default to BAAI reranker; weights (>2 GB) load on first use
+            self._reranker = None
+            self._reranker_lock = threading.Lock()
+            self._device = "cuda" if torch.cuda.is_available() else "cpu"
+            self._dtype = _resolve_dtype(dtype, self._device)
+            self.backend = "baai"
+
+    @property
+    def reranker(self):
+        """Lazy load FlagReranker (BAAI backend) with FP16 fallback"""
+        if self._reranker is None:
+            with self._reranker_lock:
+                if self._reranker is None:
+                    try:
+                        reranker = FlagReranker(self.model_name, use_fp16=True)
+                    except Exception as e:
+                        print(f"⚠️ FP16 initialization failed: {e}")
+                        print("   Falling back to FP32...")
+                        reranker = FlagReranker(self.model_name, use_fp16=False)
+                    # Scored by calling the HF model directly (see _score_torch)
+                    reranker.model.to(device=self._device, dtype=self._dtype).eval()
+                    self._reranker = reranker
+        return self._reranker
 
     def rerank(
         self, query: str, passages: list[str], threshold: float = 0.3
@@ -124,6 +181,15 @@ class Reranker:
         if not passages:
             return []
 
+        # Quoted lookups that appear verbatim in a passage: the retrieval
+        # order is already right, skip the cross-encoder. Unquoted short
+        # queries still go through the model and threshold, since two-syllable
+        # Vietnamese terms ("đau đầu") appear verbatim in many weak passages
+        literal_hits = self._literal_matches(query, passages)
+        if literal_hits:
+            print(f"[RERANK] Literal match for {query[:50]!r}: {len(literal_hits)} docs, skipped model")
+            return literal_hits[: self.top_n]
+
         if self.backend == "cohere":
             results = self.reranker.rerank(
                 query=query,
@@ -137,22 +203,17 @@ class Reranker:
             reranked_passages = [passages[result.index] for result in filtered_results]
             scores = [result.relevance_score for result in filtered_results]
 
-        else:  # BAAI reranker
-            scores = self.reranker.compute_score(
-                [[query, passage] for passage in passages], normalize=True
-            )
+        else:  # BAAI reranker (PyTorch or ONNX)
+            # All candidates are scored together (one forward per batch_size pairs)
+            scores = np.asarray(self._score(query, passages), dtype=np.float32)
 
             # ✅ TUNED: Filter by threshold before sorting
-            filtered_pairs = [
-                (score, passage)
-                for score, passage in zip(scores, passages)
-                if score >= threshold
-            ]
+            keep = np.flatnonzero(scores >= threshold)
 
             # Sort descending by score
-            reranked_pairs = sorted(filtered_pairs, key=lambda x: x[0], reverse=True)
-            reranked_passages = [p for _, p in reranked_pairs[: self.top_n]]
-            scores = [s for s, _ in reranked_pairs[: self.top_n]]
+            keep = keep[np.argsort(-scores[keep], kind="stable")][: self.top_n]
+            reranked_passages = [passages[i] for i in keep]
+            scores = scores[keep].tolist()
 
         print(f"[RERANK] Query: {query[:50]}...")
         print(
@@ -160,3 +221,105 @@ class Reranker:
         )
         print(f"[RERANK] Scores: {[f'{s:.3f}' for s in scores[:self.top_n]]}")
         return reranked_passages
+
+    @staticmethod
+    def _literal_matches(query, passages):
+        """Passages containing a quoted query verbatim"""
+        q = query.strip()
+        if not (len(q) > 1 and q.startswith('"') and q.endswith('"')):
+            return []
+        needle = q.strip('"').strip().lower()
+        if not needle:
+            return []
+        return [p for p in passages if needle in p.lower()]
+
+    @staticmethod
+    def _digest(text):
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _score(self, query, passages):
+        """
+        Normalized (0-1) relevance score of each passage for the query
+
+        Cached per (query, passage) pair; only cache misses reach the model.
+        """
+        query_digest = self._digest(query)
+        keys = [(query_digest, self._digest(p)) for p in passages]
+
+        scores = [None] * len(passages)
+        with self._scores_lock:
+            for i, key in enumerate(keys):
+                scores[i] = self._scores.get(key)
+        misses = [i for i, score in enumerate(scores) if score is None]
+        if not misses:
+            return scores
+
+        fresh = self._compute_scores(query, [passages[i] for i in misses])
+        with self._scores_lock:
+            for i, score in zip(misses, fresh):
+                scores[i] = score
+                self._scores[keys[i]] = score
+        return scores
+
+    def _compute_scores(self, query, passages):
+        """
+        Model scores for passages (uncached _score)
+
+        Passages are scored shortest-first so each batch pads to a similar
+        length (less wasted attention compute), then scores are put back in
+        the original order.
+        """
+        order = np.argsort([len(p) for p in passages], kind="stable")
+        ordered = [passages[i] for i in order]
+
+        if self.backend == "onnx":
+            ordered_scores = self._score_onnx(query, ordered)
+        else:
+            ordered_scores = self._score_torch(query, ordered)
+
+        scores = [0.0] * len(passages)
+        for position, i in enumerate(order):
+            scores[i] = ordered_scores[position]
+        return scores
+
+    def _score_torch(self, query, passages):
+        # Tokenize each batch in one fast-tokenizer call and run the model
+        # directly, instead of FlagReranker.compute_score's per-call setup
+        reranker = self.reranker
+        model, tokenizer = reranker.model, reranker.tokenizer
+
+        logits = []
+        with torch.inference_mode():
+            for start in range(0, len(passages), self.batch_size):
+                batch = passages[start:start + self.batch_size]
+                encoded = tokenizer(
+                    [query] * len(batch),
+                    batch,
+                    padding=True,
+                    truncation=True,
+                    max_length=self.max_length,
+                    return_tensors="pt",
+                ).to(self._device)
+                # Upcast before the sigmoid (bf16 has ~3 significant digits)
+                logits.append(model(**encoded).logits.view(-1).float())
+        # Same sigmoid FlagReranker applies for normalize=True
+        return torch.sigmoid(torch.cat(logits)).cpu().tolist()
+
+    def _score_onnx(self, query, passages):
+        # Pairs tokenized per batch (dynamic padding) and scored with session.run
+        logits = []
+        for start in range(0, len(passages), self.batch_size):
+            batch = passages[start:start + self.batch_size]
+            encoded = self.tokenizer(
+                [query] * len(batch),
+                batch,
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            inputs = {name: encoded[name] for name in self._onnx_inputs}
+            logits.append(self.session.run(None, inputs)[0][:, 0])
+        logits = np.concatenate(logits)
+        # Same sigmoid FlagReranker applies for normalize=True
+        return (1.0 / (1.0 + np.exp(-logits))).tolist()
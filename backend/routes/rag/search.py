@@ -1,8 +1,124 @@
+import asyncio
 import os
-from dotenv import load_dotenv
-from langchain_community.retrievers import BM25Retriever
+import pickle
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-load_dotenv()
+import numpy as np
+import xxhash
+from langchain_core.documents import Document
+from rank_bm25 import BM25Okapi
+from scipy.sparse import csc_matrix
+
+# Runs the Pinecone leg of hybrid search next to BM25 (shared by all requests)
+_VECTOR_SEARCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="vector-search")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Standard RRF damping constant (keeps top ranks from dominating the fusion)
+RRF_K = 60
+
+
+def _tokenize(text):
+    """BM25 tokens: lowercased word characters (Vietnamese diacritics included)"""
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _freeze_bm25(bm25):
+    """
+    Precompute a BM25Okapi index as arrays
+
+    Returns:
+        tuple: (vocab term -> column, float32 IDF per column,
+                (N docs x V terms) CSC matrix of BM25 term weights
+                (k1+1)*f / (f + k1*(1-b+b*len_d/avgdl)))
+
+    Scores then equal BM25Okapi.get_scores: the weighted sum of the query
+    terms' columns, one sparse matvec instead of a Python loop per term.
+    """
+    vocab = {term: col for col, term in enumerate(bm25.idf)}
+    idf = np.fromiter(bm25.idf.values(), dtype=np.float32, count=len(vocab))
+
+    rows, cols, freqs = [], [], []
+    for row, doc_freqs in enumerate(bm25.doc_freqs):
+        rows.extend([row] * len(doc_freqs))
+        cols.extend(vocab[term] for term in doc_freqs)
+        freqs.extend(doc_freqs.values())
+    rows = np.asarray(rows, dtype=np.int32)
+    freqs = np.asarray(freqs, dtype=np.float32)
+
+    doc_len = np.asarray(bm25.doc_len, dtype=np.float32)
+    norm = bm25.k1 * (1 - bm25.b + bm25.b * doc_len / bm25.avgdl)
+    weights = freqs * (bm25.k1 + 1) / (freqs + norm[rows])
+
+    tf = csc_matrix(
+        (weights, (rows, np.asarray(cols, dtype=np.int32))),
+        shape=(len(doc_len), len(vocab)),
+        dtype=np.float32,
+    )
+    return vocab, idf, tf
+
+
+def _corpus_digest(splits):
+    """Fingerprint of the chunk texts a persisted BM25 index was built from"""
+    digest = xxhash.xxh3_64()
+    for doc in splits:
+        digest.update(doc.page_content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _save_bm25_index(index_dir, key, vocab, idf, tf):
+    """
+    Persist a frozen BM25 index as raw .npy arrays (memory-mappable) + vocab
+
+    Args:
+        index_dir: Directory to write into
+        key: _corpus_digest of the splits
+        vocab, idf, tf: Output of _freeze_bm25
+    """
+    try:
+        os.makedirs(index_dir, exist_ok=True)
+        meta_path = os.path.join(index_dir, "meta.pkl")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)  # Invalidate before overwriting the arrays
+        np.save(os.path.join(index_dir, "idf.npy"), idf)
+        np.save(os.path.join(index_dir, "tf_data.npy"), tf.data)
+        np.save(os.path.join(index_dir, "tf_indices.npy"), tf.indices.astype(np.int32))
+        np.save(os.path.join(index_dir, "tf_indptr.npy"), tf.indptr.astype(np.int32))
+        # Written last: a complete meta.pkl marks the index as usable
+        with open(meta_path, "wb") as f:
+            pickle.dump((key, tf.shape, vocab), f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError as e:
+        print(f"⚠️ Could not persist BM25 index to {index_dir}: {e}")
+
+
+def _load_bm25_index(index_dir, key):
+    """
+    Memory-map a persisted BM25 index if it was built from the same corpus
+
+    Returns:
+        tuple: (vocab, idf, tf) as from _freeze_bm25, or None
+    """
+    try:
+        with open(os.path.join(index_dir, "meta.pkl"), "rb") as f:
+            saved_key, shape, vocab = pickle.load(f)
+        if saved_key != key:
+            return None
+
+        def _mmap(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        # Read-only page-cache mappings: every worker process shares them
+        tf = csc_matrix(
+            (_mmap("tf_data.npy"), _mmap("tf_indices.npy"), _mmap("tf_indptr.npy")),
+            shape=shape,
+            copy=False,
+        )
+        return vocab, _mmap("idf.npy"), tf
+    except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+        return None
 
 
 class Searching:
@@ -11,7 +127,7 @@ class Searching:
     Pure implementation without LangChain EnsembleRetriever
     """
 
-    def __init__(self, k1, k2, embedding_instance, splits):
+    def __init__(self, k1, k2, embedding_instance, splits, index_path=None):
         """
         Initialize hybrid search
 
@@ -20,38 +136,66 @@ class Searching:
             k2: Number of results for BM25 search
             embedding_instance: Embedding class instance (with similarity_search method)
             splits: Document splits for BM25
+            index_path: Directory for a persisted BM25 index (None = build
+                in memory every time); rebuilt when the splits change
         """
         self.k1 = k1
         self.k2 = k2
         self.embedding = embedding_instance
 
-        # BM25 retriever
+        # BM25 index: corpus tokenized once here, documents kept as parallel
+        # arrays and only turned back into Documents for the top-k
         print("🔍 Initializing BM25 retriever...")
-        self.bm25_retriever = BM25Retriever.from_documents(splits)
-        self.bm25_retriever.k = k2
+        self._contents = np.array([d.page_content for d in splits], dtype=object)
+        self._metas = [d.metadata for d in splits]
+        # BM25Okapi computes the statistics (IDF incl. its epsilon floor),
+        # then is frozen into arrays and dropped
+        index = None
+        if index_path:
+            key = _corpus_digest(splits)
+            index = _load_bm25_index(index_path, key)
+        if index is None:
+            index = _freeze_bm25(BM25Okapi([_tokenize(d.page_content) for d in splits]))
+            if index_path:
+                _save_bm25_index(index_path, key, *index)
+        self._vocab, self._idf, self._tf = index
         print(f"✅ BM25 ready with {len(splits)} documents")
 
-    def vector_search(self, query):
+    def vector_search(self, query, query_embedding=None):
         """
         Perform vector semantic search via Pinecone
 
         Args:
             query: Search query
+            query_embedding: Precomputed query embedding (skips re-embedding)
 
         Returns:
             List of search results
         """
         print(f"🔍 Vector search for: {query}")
-        results = self.embedding.similarity_search(query, k=self.k1)
+        results = self.embedding.similarity_search(
+            query, k=self.k1, query_embedding=query_embedding
+        )
+        return self._to_documents(results)
 
-        # Convert to LangChain Document format for compatibility
-        from langchain_core.documents import Document
+    async def avector_search(self, query, query_embedding=None):
+        """Async vector_search (the Pinecone round trip does not block the loop)"""
+        print(f"🔍 Vector search for: {query}")
+        results = await self.embedding.similarity_search_async(
+            query, k=self.k1, query_embedding=query_embedding
+        )
+        return self._to_documents(results)
 
+    @staticmethod
+    def _to_documents(results):
+        # Convert to LangChain Document format for compatibility; the
+        # Pinecone similarity rides along as metadata["vector_score"]
         docs = []
         for result in results:
             docs.append(
                 Document(
-                    page_content=result["text"], metadata=result.get("metadata", {})
+                    page_content=result["text"],
+                    metadata={**result.get("metadata", {}), "vector_score": result["score"]},
                 )
             )
         return docs
@@ -67,9 +211,34 @@ class Searching:
             List of documents
         """
         print(f"🔍 BM25 search for: {query}")
-        return self.bm25_retriever.invoke(query)
+        n = len(self._contents)
+        k = min(self.k2, n)
+        if k == 0:
+            return []
 
-    def hybrid_search(self, query, vector_weight=0.6, bm25_weight=0.4):
+        # Query term counts: a repeated term counts again, as in get_scores
+        counts = defaultdict(int)
+        for token in _tokenize(query):
+            col = self._vocab.get(token)
+            if col is not None:
+                counts[col] += 1
+        if counts:
+            cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            weights = self._idf[cols] * np.fromiter(
+                counts.values(), dtype=np.float32, count=len(counts)
+            )
+            scores = self._tf[:, cols] @ weights
+        else:
+            scores = np.zeros(n, dtype=np.float32)
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            Document(page_content=self._contents[i], metadata=self._metas[i])
+            for i in top
+        ]
+
+    def hybrid_search(self, query, vector_weight=0.6, bm25_weight=0.4, query_embedding=None):
         """
         Perform hybrid search (BM25 + Vector)
         ✅ TUNED: Changed weights from 0.3/0.7 to 0.5/0.5 for better semantic matching
@@ -78,37 +247,55 @@ class Searching:
             query: Search query
             vector_weight: Weight for vector search (default: 0.5, was 0.3)
             bm25_weight: Weight for BM25 search (default: 0.5, was 0.7)
+            query_embedding: Precomputed query embedding for the vector leg
 
         Returns:
-            List of documents (merged and deduplicated)
+            List of documents (deduplicated, ordered by fused RRF score)
         """
         print(f"🔍 Hybrid search for: {query}")
 
-        # Get results from both methods
-        vector_docs = self.vector_search(query)
+        # Get results from both methods: embed + Pinecone round trip runs in
+        # the background while BM25 scores locally
+        vector_future = _VECTOR_SEARCH_POOL.submit(
+            self.vector_search, query, query_embedding
+        )
         bm25_docs = self.bm25_search(query)
+        vector_docs = vector_future.result()
+
+        return self._fuse(bm25_docs, vector_docs, vector_weight, bm25_weight)
+
+    async def ahybrid_search(self, query, vector_weight=0.6, bm25_weight=0.4, query_embedding=None):
+        """
+        Async hybrid_search: BM25 (worker thread) and the Pinecone query are
+        awaited together, same fusion and return value
+        """
+        print(f"🔍 Hybrid search for: {query}")
+        bm25_docs, vector_docs = await asyncio.gather(
+            asyncio.to_thread(self.bm25_search, query),
+            self.avector_search(query, query_embedding),
+        )
+        return self._fuse(bm25_docs, vector_docs, vector_weight, bm25_weight)
+
+    @staticmethod
+    def _fuse(bm25_docs, vector_docs, vector_weight, bm25_weight):
+        # Weighted Reciprocal Rank Fusion: score(d) = sum_i w_i / (RRF_K + rank_i(d)).
+        # Documents are identified by a hash of their full content, so a
+        # passage found by both legs is merged and gets both contributions.
+        # The vector-leg copy is kept so metadata["vector_score"] survives
+        scores = defaultdict(float)
+        docs_by_id = {}
+        for docs, weight in ((bm25_docs, bm25_weight), (vector_docs, vector_weight)):
+            is_vector_leg = docs is vector_docs
+            for rank, doc in enumerate(docs, start=1):
+                doc_id = xxhash.xxh3_64_intdigest(doc.page_content)
+                scores[doc_id] += weight / (RRF_K + rank)
+                if is_vector_leg or doc_id not in docs_by_id:
+                    docs_by_id[doc_id] = doc
 
-        # Simple merge: combine and deduplicate by content
-        seen_content = set()
-        merged_docs = []
-
-        # Add BM25 results first (higher weight)
-        for doc in bm25_docs[
-            : int(self.k2 * bm25_weight / (vector_weight + bm25_weight))
-        ]:
-            content = doc.page_content[:100]  # Use first 100 chars as key
-            if content not in seen_content:
-                seen_content.add(content)
-                merged_docs.append(doc)
-
-        # Add vector results
-        for doc in vector_docs[
-            : int(self.k1 * vector_weight / (vector_weight + bm25_weight))
-        ]:
-            content = doc.page_content[:100]
-            if content not in seen_content:
-                seen_content.add(content)
-                merged_docs.append(doc)
+        merged_docs = [
+            docs_by_id[doc_id]
+            for doc_id in sorted(scores, key=scores.__getitem__, reverse=True)
+        ]
 
         print(f"✅ Found {len(merged_docs)} unique documents")
         return merged_docs
@@ -1,32 +1,186 @@
 import os
-from dotenv import load_dotenv
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
+import pickle
+import re
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from langchain_community.document_loaders import TextLoader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from bs4 import BeautifulSoup
+from joblib import Parallel, delayed
 
-load_dotenv()
+# selectolax (C parser) is optional: without it HTML is parsed by bs4
+try:
+    from selectolax.parser import HTMLParser
+except ImportError:
+    HTMLParser = None
 
+# preprocess_context: "\n" -> " ", "*" -> "" in one C-level pass
+_CONTEXT_TABLE = str.maketrans({"\n": " ", "*": None})
 
-def load_corpus(corpus_path, chunk_size=800, chunk_overlap=200):
+# _fast_split: zero-width split right after every "." / "\n" (separators kept)
+_SENTENCE_END_RE = re.compile(r"(?<=[.\n])")
+
+
+def _html_to_text(html):
     """
-    Load toàn bộ text/HTML từ thư mục corpus_path và chia nhỏ thành chunks.
+    Plain text of an HTML string (same output as BeautifulSoup.get_text()).
+    Dùng selectolax nếu có, BeautifulSoup khi không có hoặc khi parse lỗi.
     """
-    text_loader_kwargs = {"autodetect_encoding": True}
-    loader = DirectoryLoader(
-        corpus_path, loader_cls=TextLoader, loader_kwargs=text_loader_kwargs
-    )
-    docs = loader.load()
+    if HTMLParser is not None:
+        try:
+            root = HTMLParser(html).root
+            return root.text(separator="") if root is not None else ""
+        except Exception:
+            pass
+    return BeautifulSoup(html, "html.parser").get_text()
 
-    # Làm sạch HTML tags
-    for doc in docs:
-        soup = BeautifulSoup(doc.page_content, "html.parser")
-        doc.page_content = soup.get_text()
 
-    # Chia nhỏ text thành chunks để đưa vào embedding
+def _load_one(path):
+    """
+    Đọc một file corpus và làm sạch HTML (chạy trong process con của load_corpus).
+    """
+    try:
+        text = path.read_text(encoding="utf-8")
+    except UnicodeDecodeError:
+        # Same encoding detection the old DirectoryLoader/TextLoader used
+        text = TextLoader(str(path), autodetect_encoding=True).load()[0].page_content
+    return Document(page_content=_html_to_text(text), metadata={"source": str(path)})
+
+
+def _fast_split(text, chunk_size, chunk_overlap):
+    """
+    Chia text theo câu bằng một lần re.split rồi gộp tham lam đến chunk_size.
+    Nhanh hơn RecursiveCharacterTextSplitter nhưng ranh giới chunk khác
+    (overlap tính theo ký tự), nên chỉ bật khi truyền fast=True.
+    """
+    step = chunk_size - chunk_overlap
+    chunks = []
+    buf = ""
+    for piece in _SENTENCE_END_RE.split(text):
+        if len(buf) + len(piece) <= chunk_size:
+            buf += piece
+            continue
+        if buf.strip():
+            chunks.append(buf.strip())
+        buf = (buf[-chunk_overlap:] if chunk_overlap else "") + piece
+        # A single sentence longer than a chunk is cut into fixed windows
+        while len(buf) > chunk_size:
+            window = buf[:chunk_size].strip()
+            if window:
+                chunks.append(window)
+            buf = buf[step:]
+    if buf.strip():
+        chunks.append(buf.strip())
+    return chunks
+
+
+def _split_shard(docs, chunk_size, chunk_overlap, fast=False):
+    """
+    Chia một nhóm documents thành chunks (splitter tạo trong worker, không pickle).
+    """
+    if fast:
+        return [
+            Document(page_content=chunk, metadata=dict(doc.metadata))
+            for doc in docs
+            for chunk in _fast_split(doc.page_content, chunk_size, chunk_overlap)
+        ]
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size, chunk_overlap=chunk_overlap, separators=["\n", "."]
     )
-    texts = text_splitter.split_documents(docs)
+    return text_splitter.split_documents(docs)
+
+
+def _corpus_cache_path(corpus_path):
+    """<corpus_path>.pkl, cạnh thư mục corpus"""
+    return Path(str(corpus_path).rstrip("/\\") + ".pkl")
+
+
+def _read_corpus_cache(cache_path, key):
+    """(docs, texts) từ file cache nếu khóa khớp, ngược lại None"""
+    try:
+        with open(cache_path, "rb") as f:
+            # Key is pickled first so a stale cache is rejected without
+            # deserializing the corpus
+            if pickle.load(f) != key:
+                return None
+            docs, texts = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    return (
+        [Document(page_content=c, metadata=m) for c, m in docs],
+        [Document(page_content=c, metadata=m) for c, m in texts],
+    )
+
+
+def _write_corpus_cache(cache_path, key, docs, texts):
+    # Plain (text, metadata) tuples: the cache does not depend on the
+    # LangChain Document class layout
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(key, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(
+                (
+                    [(d.page_content, d.metadata) for d in docs],
+                    [(d.page_content, d.metadata) for d in texts],
+                ),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠️ Không ghi được corpus cache {cache_path}: {e}")
+
+
+def load_corpus(corpus_path, chunk_size=800, chunk_overlap=200, fast=False, use_cache=True):
+    """
+    Load toàn bộ text/HTML từ thư mục corpus_path và chia nhỏ thành chunks.
+    Đọc file + làm sạch HTML chạy song song trên nhiều process (mỗi file độc lập).
+    fast=True dùng _fast_split thay cho RecursiveCharacterTextSplitter.
+    use_cache=True: kết quả được lưu vào <corpus_path>.pkl và dùng lại khi
+    corpus (mtime mới nhất, số file) và tham số chia chunk không đổi.
+    """
+    # Same files DirectoryLoader picked up: every non-hidden file, recursively
+    paths = sorted(
+        p for p in Path(corpus_path).rglob("*") if p.is_file() and not p.name.startswith(".")
+    )
+
+    cache_path = _corpus_cache_path(corpus_path)
+    key = (
+        max((p.stat().st_mtime for p in paths), default=0.0),
+        len(paths),
+        chunk_size,
+        chunk_overlap,
+        fast,
+    )
+    if use_cache:
+        cached = _read_corpus_cache(cache_path, key)
+        if cached is not None:
+            return cached
+
+    workers = min(os.cpu_count() or 1, len(paths))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            docs = list(executor.map(_load_one, paths, chunksize=32))
+    else:
+        docs = [_load_one(p) for p in paths]
+
+    # Chia nhỏ text thành chunks để đưa vào embedding
+    # (các shard độc lập, chia song song; thứ tự chunks giữ nguyên)
+    if workers > 1:
+        shard_size = -(-len(docs) // workers)
+        parts = Parallel(n_jobs=workers, backend="loky")(
+            delayed(_split_shard)(docs[i:i + shard_size], chunk_size, chunk_overlap, fast)
+            for i in range(0, len(docs), shard_size)
+        )
+        texts = [chunk for part in parts for chunk in part]
+    else:
+        texts = _split_shard(docs, chunk_size, chunk_overlap, fast)
+
+    if use_cache:
+        _write_corpus_cache(cache_path, key, docs, texts)
     return docs, texts
 
 
@@ -36,14 +190,16 @@ def get_text_from_html_file(html_path):
     """
     with open(html_path, "r", encoding="utf-8") as f:
         html_text = f.read()
-    soup = BeautifulSoup(html_text, "html.parser")
-    return soup.get_text()
+    return _html_to_text(html_text)
 
 
-def get_text_chunks(raw_text, chunk_size=1000, chunk_overlap=200):
+def get_text_chunks(raw_text, chunk_size=1000, chunk_overlap=200, fast=False):
     """
     Chia nhỏ raw text thành các đoạn nhỏ (chunks).
+    fast=True dùng _fast_split (chia theo câu) thay cho RecursiveCharacterTextSplitter.
     """
+    if fast:
+        return _fast_split(raw_text, chunk_size, chunk_overlap)
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
@@ -58,13 +214,24 @@ def preprocess_context(context: list):
         return []
 
     # Làm sạch context
-    cleaned_context = []
-    for item in context:
-        if isinstance(item, str):
-            cleaned_item = item.replace("\n", " ").replace("*", "").strip()
-            if cleaned_item:
-                cleaned_context.append(cleaned_item)
-    return cleaned_context
+    cleaned = (
+        item.translate(_CONTEXT_TABLE).strip() for item in context if isinstance(item, str)
+    )
+    return [item for item in cleaned if item]
+
+
+def normalize_query(query: str) -> str:
+    """
+    Chuẩn hóa câu hỏi để làm khóa cache.
+    (NFKC, chữ thường, bỏ emoji/ký tự định dạng, gộp khoảng trắng)
+    """
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = "".join(
+        ch
+        for ch in text
+        if unicodedata.category(ch) not in ("So", "Sk", "Cf") and ch != "\ufe0f"
+    )
+    return " ".join(text.split())
 
 
 if __name__ == "__main__":
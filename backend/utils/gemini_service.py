@@ -6,22 +6,41 @@ load_dotenv()
 
 genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
 
+# Created once per process and reused by every call
+model = genai.GenerativeModel('gemini-2.5-flash')
+
+_SPEAKERS = {'user': 'Người dùng', 'assistant': 'Trợ lý'}
+
 def call_gemini(messages):
+    """
+    Stream the assistant reply for a conversation
+
+    Args:
+        messages: List of {'role': 'user' | 'assistant', 'content': str}
+
+    Yields:
+        str: Text chunks as Gemini produces them
+    """
     try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt= "Bạn là trợ lý AI thông minh và thân thiện.\n\n"
-        
-        for msg in messages:
-            if msg['role'] == 'user':
-                prompt += f"Người dùng: {msg['content']}\n"
-            elif msg['role'] == 'assistant':
-                prompt += f"Trợ lý: {msg['content']}\n"
-        
-        prompt += "Trợ lý: "
-        
-        response = model.generate_content(prompt)
-        return response.text
-    
+        parts = ["Bạn là trợ lý AI thông minh và thân thiện.\n\n"]
+        parts.extend(
+            f"{_SPEAKERS[msg['role']]}: {msg['content']}\n"
+            for msg in messages
+            if msg['role'] in _SPEAKERS
+        )
+        parts.append("Trợ lý: ")
+        prompt = "".join(parts)
+
+        response = model.generate_content(prompt, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. only finish_reason)
+                continue
+            if text:
+                yield text
+
     except Exception as e:
         print(f"Lỗi khi gọi Gemini API: {str(e)}")
-        raise Exception("Lỗi khi gọi Gemini API")
\ No newline at end of file
+        raise Exception("Lỗi khi gọi Gemini API")
@@ -3,7 +3,10 @@ Centralized logging configuration for the application.
 Provides consistent logging across all modules.
 """
 
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 from pathlib import Path
 from datetime import datetime
@@ -14,11 +17,73 @@ LOGS_DIR.mkdir(exist_ok=True)
 
 # Log file path with date
 LOG_FILE = LOGS_DIR / f"app_{datetime.now().strftime('%Y%m%d')}.log"
+LOG_MAX_BYTES = 50 * 1024 * 1024  # Rotate at 50 MB, keep 5 old files
+LOG_BACKUP_COUNT = 5
+LOG_BUFFER_BYTES = 64 * 1024
+
+# Records waiting for the background listener (see below)
+_log_queue = queue.Queue(-1)
+
+
+class _BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler writing through a 64 KiB buffer.
+
+    The buffer is flushed only once the log queue is drained, so a burst of
+    records costs one write syscall instead of one per line.
+    """
+
+    def _open(self):
+        return open(
+            self.baseFilename,
+            self.mode,
+            buffering=LOG_BUFFER_BYTES,
+            encoding=self.encoding,
+            errors=self.errors,
+        )
+
+    def flush(self):
+        if _log_queue.empty():
+            super().flush()
+
+
+# Console Handler (INFO and above)
+_console_handler = logging.StreamHandler(sys.stdout)
+_console_handler.setLevel(logging.INFO)
+_console_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s", datefmt="%H:%M:%S"
+    )
+)
+
+# File Handler (DEBUG and above)
+_file_handler = _BufferedRotatingFileHandler(
+    LOG_FILE,
+    maxBytes=LOG_MAX_BYTES,
+    backupCount=LOG_BACKUP_COUNT,
+    encoding="utf-8",
+    delay=True,
+)
+_file_handler.setLevel(logging.DEBUG)
+_file_handler.setFormatter(
+    logging.Formatter(
+        "%(asctime)s | %(levelname)-8s | %(name)s:%(lineno)d | %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+)
+
+# Loggers only enqueue records; console/file I/O happens on the listener's
+# background thread, so request handlers never block on a disk write
+_listener = logging.handlers.QueueListener(
+    _log_queue, _console_handler, _file_handler, respect_handler_level=True
+)
+_listener.start()
+atexit.register(_listener.stop)  # Flush queued records on shutdown
 
 
 def setup_logger(name: str = __name__) -> logging.Logger:
     """
-    Setup and configure logger with both file and console handlers.
+    Setup and configure logger (console + file, written by a background thread).
 
     Args:
         name: Logger name (usually __name__ from calling module)
@@ -33,26 +98,7 @@ def setup_logger(name: str = __name__) -> logging.Logger:
         return logger
 
     logger.setLevel(logging.DEBUG)
-
-    # Console Handler (INFO and above)
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s", datefmt="%H:%M:%S"
-    )
-    console_handler.setFormatter(console_formatter)
-
-    # File Handler (DEBUG and above)
-    file_handler = logging.FileHandler(LOG_FILE, encoding="utf-8")
-    file_handler.setLevel(logging.DEBUG)
-    file_formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)-8s | %(name)s:%(lineno)d | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-    )
-    file_handler.setFormatter(file_formatter)
-
-    logger.addHandler(console_handler)
-    logger.addHandler(file_handler)
+    logger.addHandler(logging.handlers.QueueHandler(_log_queue))
 
     return logger
 
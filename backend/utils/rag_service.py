@@ -3,19 +3,19 @@ Optimized RAG Service with caching and reduced retrieval
 """
 
 import os
+import asyncio
 import logging
-from dotenv import load_dotenv
+import threading
+import torch
 
-import sys
+from routes.rag.embedding import Embedding
+from routes.rag.search import Searching
+from routes.rag.utils import load_corpus, preprocess_context
+from routes.rag.llms import LLM
+from routes.rag.reranker import Reranker
+from config.constants import CacheConfig, RAGConfig
+from utils.semantic_cache import SemanticCache
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../..")))
-from backend.routes.rag.embedding import Embedding
-from backend.routes.rag.search import Searching
-from backend.routes.rag.utils import load_corpus, preprocess_context
-from backend.routes.rag.llms import LLM
-from backend.routes.rag.reranker import Reranker
-
-load_dotenv()
 logger = logging.getLogger(__name__)
 
 
@@ -47,6 +47,16 @@ class RAGService:
         self._llm = None
         self._reranker = None
 
+        # Paraphrased queries skip search + rerank entirely. embed_fn is only
+        # called on lookup, so the embedding model still loads lazily.
+        # Entries expire so a re-indexed corpus becomes visible
+        self._retrieval_cache = SemanticCache(
+            embed_fn=lambda text: self.vectorstore.embed_query(text),
+            threshold=CacheConfig.RETRIEVAL_CACHE_THRESHOLD,
+            maxsize=CacheConfig.RETRIEVAL_CACHE_SIZE,
+            ttl=CacheConfig.RETRIEVAL_CACHE_TTL,
+        )
+
         logger.info("RAG Service initialized (lazy loading enabled)")
         logger.info(f"   - Reranker: {'Enabled' if use_reranker else 'Disabled'}")
 
@@ -57,6 +67,7 @@ class RAGService:
             logger.info("Loading Pinecone vectorstore...")
             embedding = Embedding(
                 model_name="BAAI/bge-m3",
+                device="cuda" if torch.cuda.is_available() else "cpu",
                 index_name=self.index_name,
                 pinecone_api_key=self.pinecone_api_key,
             )
@@ -83,6 +94,8 @@ class RAGService:
                 k2=5,  # TUNED: Reduced from 10 to 5 for better precision
                 embedding_instance=self.vectorstore,
                 splits=self.splits,
+                # Memory-mapped BM25 arrays, shared by every worker process
+                index_path=f"{self.corpus_path.rstrip('/')}.bm25" if self.corpus_path else None,
             )
             logger.info("Search engine ready!")
         return self._search_engine
@@ -96,6 +109,13 @@ class RAGService:
                 model_name="models/gemini-2.5-flash",
                 temperature=0.4,
                 language="vi",
+                cache_path=CacheConfig.LLM_CACHE_PATH,
+                # Paraphrases reuse the retrieval model's query embeddings
+                semantic_cache=SemanticCache(
+                    embed_fn=self.vectorstore.embed_query,
+                    threshold=CacheConfig.SEMANTIC_CACHE_THRESHOLD,
+                    maxsize=CacheConfig.LLM_SEMANTIC_CACHE_SIZE,
+                ),
             )
             logger.info("LLM ready!")
         return self._llm
@@ -106,7 +126,11 @@ class RAGService:
         if self._reranker is None and self.use_reranker:
             logger.info(f"Initializing reranker ({self.reranker_model})...")
             try:
-                self._reranker = Reranker(model_name=self.reranker_model, top_n=5)
+                self._reranker = Reranker(
+                    model_name=self.reranker_model,
+                    top_n=5,
+                    backend=RAGConfig.RERANKER_BACKEND,
+                )
                 logger.info("Reranker ready!")
             except Exception as e:
                 logger.warning(f"Reranker initialization failed: {e}")
@@ -136,40 +160,100 @@ class RAGService:
             )
             initial_k = top_k * 2 if should_rerank else top_k
 
+            # Embed once: the same vector keys the semantic cache and feeds
+            # the vector search leg
+            query_embedding = self.vectorstore.embed_query(query)
+            cache_params = (top_k, search_type, bool(should_rerank))
+            query_vec = self._retrieval_cache.normalize(query_embedding)
+            cached = self._retrieval_cache.lookup(
+                query_vec, accept=lambda entry: entry[0] == cache_params
+            )
+            if cached is not None:
+                logger.info(f"Retrieval cache hit: {len(cached[1])} documents")
+                return list(cached[1])
+
             # Search
             if search_type == "hybrid":
-                docs = self.search_engine.hybrid_search(query)
+                docs = self.search_engine.hybrid_search(
+                    query, query_embedding=query_embedding
+                )
             elif search_type == "vector":
-                docs = self.search_engine.vector_search(query)
+                docs = self.search_engine.vector_search(query, query_embedding)
             elif search_type == "bm25":
                 docs = self.search_engine.bm25_search(query)
             else:
-                docs = self.search_engine.hybrid_search(query)
-
-            # Extract content
-            context_candidates = self.search_engine.get_context(docs[:initial_k])
-            logger.info(f"   Retrieved {len(context_candidates)} candidates")
-
-            # Rerank if enabled
-            final_context = context_candidates
-            if should_rerank and self.reranker:
-                logger.info(f"Reranking to top-{top_k}...")
-                try:
-                    # TUNED: Pass threshold to filter low-score docs
-                    final_context = self.reranker.rerank(
-                        query, context_candidates, threshold=0.3
-                    )
-                    logger.info("   Reranked")
-                except Exception as e:
-                    logger.warning(f"   Reranking failed: {e}")
-                    final_context = context_candidates[:top_k]
+                docs = self.search_engine.hybrid_search(
+                    query, query_embedding=query_embedding
+                )
+
+            cleaned_context = self._finalize_context(
+                query, docs, top_k, initial_k, should_rerank
+            )
+
+            if cleaned_context:
+                self._retrieval_cache.add(query_vec, (cache_params, tuple(cleaned_context)))
+            return cleaned_context
+
+        except Exception as e:
+            logger.error(f"Error retrieving context: {e}")
+            import traceback
+
+            traceback.print_exc()
+            return []
+
+    async def aretrieve_context(self, query, top_k=5, search_type="hybrid", use_reranker=None):
+        """
+        Async retrieve_context (same arguments, cache and return value)
+
+        BM25 and the Pinecone query are awaited together, so one event loop
+        can keep many RAG queries in flight; embedding and reranking run in
+        worker threads.
+
+        Args:
+            query: User query
+            top_k: Final number of documents (default: 5)
+            search_type: 'hybrid', 'vector', or 'bm25'
+            use_reranker: Override class setting
+
+        Returns:
+            list: Retrieved and cleaned document contents
+        """
+        try:
+            logger.info(f"Retrieving (top-{top_k}, async)...")
+
+            should_rerank = (
+                use_reranker if use_reranker is not None else self.use_reranker
+            )
+            initial_k = top_k * 2 if should_rerank else top_k
+
+            query_embedding = await asyncio.to_thread(
+                lambda: self.vectorstore.embed_query(query)
+            )
+            cache_params = (top_k, search_type, bool(should_rerank))
+            query_vec = self._retrieval_cache.normalize(query_embedding)
+            cached = self._retrieval_cache.lookup(
+                query_vec, accept=lambda entry: entry[0] == cache_params
+            )
+            if cached is not None:
+                logger.info(f"Retrieval cache hit: {len(cached[1])} documents")
+                return list(cached[1])
+
+            search_engine = await asyncio.to_thread(lambda: self.search_engine)
+            if search_type == "vector":
+                docs = await search_engine.avector_search(query, query_embedding)
+            elif search_type == "bm25":
+                docs = await asyncio.to_thread(search_engine.bm25_search, query)
             else:
-                final_context = context_candidates[:top_k]
+                docs = await search_engine.ahybrid_search(
+                    query, query_embedding=query_embedding
+                )
 
-            # Clean and return
-            cleaned_context = preprocess_context(final_context)
-            logger.info(f"Final: {len(cleaned_context)} documents")
+            cleaned_context = await asyncio.to_thread(
+                self._finalize_context, query, docs, top_k, initial_k, should_rerank
+            )
 
+            if cleaned_context:
+                self._retrieval_cache.add(query_vec, (cache_params, tuple(cleaned_context)))
             return cleaned_context
 
         except Exception as e:
@@ -179,6 +263,50 @@ class RAGService:
             traceback.print_exc()
             return []
 
+    def _finalize_context(self, query, docs, top_k, initial_k, should_rerank):
+        """
+        Candidates -> (optionally reranked) cleaned context (blocking)
+
+        Shared by retrieve_context and aretrieve_context.
+        """
+        # Extract content
+        candidates = docs[:initial_k]
+        context_candidates = self.search_engine.get_context(candidates)
+        logger.info(f"   Retrieved {len(context_candidates)} candidates")
+
+        # A near-exact vector match is trusted as is: keep the vector ranking,
+        # so BM25-only hits from the fused list do not ride along
+        top_vector_score = max(
+            (doc.metadata.get("vector_score", 0.0) for doc in candidates),
+            default=0.0,
+        )
+        if should_rerank and top_vector_score > RAGConfig.RERANK_SKIP_VECTOR_SCORE:
+            logger.info(f"Skipping rerank (top vector score {top_vector_score:.3f})")
+            vector_docs = sorted(
+                (doc for doc in candidates if "vector_score" in doc.metadata),
+                key=lambda doc: doc.metadata["vector_score"],
+                reverse=True,
+            )
+            final_context = self.search_engine.get_context(vector_docs[:top_k])
+        elif should_rerank and self.reranker:
+            logger.info(f"Reranking to top-{top_k}...")
+            try:
+                # TUNED: Pass threshold to filter low-score docs
+                final_context = self.reranker.rerank(
+                    query, context_candidates, threshold=0.3
+                )
+                logger.info("   Reranked")
+            except Exception as e:
+                logger.warning(f"   Reranking failed: {e}")
+                final_context = context_candidates[:top_k]
+        else:
+            final_context = context_candidates[:top_k]
+
+        # Clean and return
+        cleaned_context = preprocess_context(final_context)
+        logger.info(f"Final: {len(cleaned_context)} documents")
+        return cleaned_context
+
     def generate_answer(
         self,
         query,
@@ -203,18 +331,20 @@ class RAGService:
             # Build context string
             context_str = None
             if context_docs and len(context_docs) > 0:
-                context_str = "\n\n".join(
-                    [f"[Document {i+1}]:\n{doc}" for i, doc in enumerate(context_docs)]
-                )
+                # One join over small headers + the docs themselves: no
+                # per-document f-string copy of several-KB chunks
+                parts = []
+                for i, doc in enumerate(context_docs):
+                    parts.append(f"\n\n[Document {i+1}]:\n" if i else "[Document 1]:\n")
+                    parts.append(doc)
+                context_str = "".join(parts)
                 logger.info(f"Context: {len(context_docs)} docs")
             else:
                 logger.warning("No context found")
 
             # Generate
             logger.info("Generating...")
-            llm_instance = self.llm
-            prompt = llm_instance.preprocess_prompt(question=query, context=context_str)
-            answer = llm_instance.generate(prompt)
+            answer = self.llm.chat(question=query, context=context_str)
 
             logger.info("Done!")
             logger.info("=" * 60)
@@ -243,15 +373,23 @@ class RAGService:
 # Global Singleton Instance
 # ==========================================
 _rag_service_instance = None
+_rag_service_lock = threading.Lock()
 
 
 def get_rag_service(use_reranker=True, reranker_model="BAAI/bge-reranker-v2-m3"):
-    """Get or create RAG service singleton"""
+    """
+    Get or create the process-wide RAG service singleton (thread-safe)
+
+    Arguments only apply on first creation; every caller shares one instance
+    so the embedding model and reranker are loaded once per process.
+    """
     global _rag_service_instance
     if _rag_service_instance is None:
-        _rag_service_instance = RAGService(
-            use_reranker=use_reranker, reranker_model=reranker_model
-        )
+        with _rag_service_lock:
+            if _rag_service_instance is None:
+                _rag_service_instance = RAGService(
+                    use_reranker=use_reranker, reranker_model=reranker_model
+                )
     return _rag_service_instance
 
 
@@ -263,7 +401,7 @@ def call_rag_gemini(messages):
     Wrapper function for Flask - Uses AGENT
     """
     try:
-        from backend.routes.agents.medical_agent_with_toolcall import chat_with_agent
+        from routes.agents.medical_agent_with_toolcall import chat_with_agent
 
         return chat_with_agent(messages)
 
@@ -273,3 +411,20 @@ def call_rag_gemini(messages):
 
         traceback.print_exc()
         return "Xin loi, toi dang gap su co ky thuat. Vui long thu lai sau."
+
+
+def stream_rag_gemini(messages):
+    """
+    Streaming wrapper for Flask - Uses AGENT, yields completed answer sections
+    """
+    try:
+        from routes.agents.medical_agent_with_toolcall import stream_with_agent
+
+        yield from stream_with_agent(messages)
+
+    except Exception as e:
+        logger.error(f"Error in stream_rag_gemini: {e}")
+        import traceback
+
+        traceback.print_exc()
+        yield "Xin loi, toi dang gap su co ky thuat. Vui long thu lai sau."
@@ -0,0 +1,61 @@
+"""
+Incremental Markdown section splitter for streamed LLM answers
+Turns a token stream into a stream of completed sections so the UI can render
+each section once instead of re-parsing the growing buffer on every token
+"""
+
+import re
+
+# Section headers the prompts produce, e.g. "**🔍 PHÂN TÍCH TRIỆU CHỨNG**" or "## ..."
+_HEADER_RE = re.compile(r"^\s*(\*\*[^*\n]+\*\*|#{1,6}\s+\S.*)\s*$")
+
+
+def iter_sections(chunks):
+    """
+    Group streamed text chunks into completed Markdown sections
+
+    State machine over complete lines:
+    - A header line closes the current section and opens a new one
+    - Until the first header is seen, blank lines close paragraphs
+      (answers in free-form style still stream progressively)
+
+    Args:
+        chunks: Iterable of text fragments (LLM token stream)
+
+    Yields:
+        str: One completed section at a time (joined back with newlines)
+    """
+    pending = ""  # Incomplete trailing line
+    section = []  # Lines of the current section
+    seen_header = False
+
+    def _flush():
+        text = "\n".join(section).strip()
+        section.clear()
+        return text
+
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending += chunk
+        *lines, pending = pending.split("\n")
+
+        for line in lines:
+            if _HEADER_RE.match(line):
+                seen_header = True
+                text = _flush()
+                if text:
+                    yield text
+                section.append(line)
+            elif not line.strip() and not seen_header:
+                text = _flush()
+                if text:
+                    yield text
+            else:
+                section.append(line)
+
+    if pending:
+        section.append(pending)
+    text = _flush()
+    if text:
+        yield text
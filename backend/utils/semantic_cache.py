@@ -0,0 +1,117 @@
+"""
+Semantic Cache for near-duplicate queries
+Serves a stored result when a new query is close enough (cosine) to a previous one
+"""
+
+import threading
+import time
+import numpy as np
+
+
+class SemanticCache:
+    """
+    Bounded in-memory semantic cache
+
+    - Embeddings are L2-normalized and kept in a fixed-size float32 ring buffer
+    - Lookup is a single matrix-vector product (cosine = dot product)
+    - Oldest entries are overwritten once `maxsize` is reached
+    - Entries older than `ttl` seconds are ignored on lookup
+
+    A brute-force scan over a few hundred rows is cheaper than maintaining
+    an ANN index, so no FAISS dependency is needed here.
+    """
+
+    def __init__(self, embed_fn, threshold=0.92, maxsize=512, ttl=None):
+        """
+        Initialize semantic cache
+
+        Args:
+            embed_fn: Callable text -> embedding vector (list or ndarray)
+            threshold: Minimum cosine similarity for a cache hit
+            maxsize: Maximum number of cached entries
+            ttl: Entry lifetime in seconds (None = no expiry)
+        """
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._vecs = None  # Allocated on first add (dimension unknown until then)
+        self._payloads = [None] * maxsize
+        self._stamps = np.zeros(maxsize, dtype=np.float64)  # Insertion time per slot
+        self._size = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def encode(self, text):
+        """
+        Embed and L2-normalize a query
+
+        Args:
+            text: Query text
+
+        Returns:
+            np.ndarray: Normalized float32 vector
+        """
+        return self.normalize(self.embed_fn(text))
+
+    @staticmethod
+    def normalize(embedding):
+        """
+        L2-normalize an embedding computed elsewhere
+
+        Args:
+            embedding: Vector (list or ndarray)
+
+        Returns:
+            np.ndarray: Normalized float32 vector
+        """
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm > 0 else vec
+
+    def lookup(self, vec, accept=None):
+        """
+        Find the most similar cached entry
+
+        Args:
+            vec: Normalized query vector (from encode)
+            accept: Optional predicate payload -> bool; entries it rejects
+                are skipped, so the nearest compatible entry is returned
+
+        Returns:
+            Cached payload if similarity >= threshold, else None
+        """
+        with self._lock:
+            if self._size == 0:
+                return None
+            sims = self._vecs[: self._size] @ vec
+            if self.ttl is not None:
+                expired = self._stamps[: self._size] < time.monotonic() - self.ttl
+                sims[expired] = -np.inf
+            hits = np.flatnonzero(sims >= self.threshold)
+            for idx in hits[np.argsort(-sims[hits])]:
+                payload = self._payloads[idx]
+                if accept is None or accept(payload):
+                    return payload
+        return None
+
+    def add(self, vec, payload):
+        """
+        Store a payload under a normalized query vector
+
+        Args:
+            vec: Normalized query vector (from encode)
+            payload: Value to return on future hits
+        """
+        with self._lock:
+            if self._vecs is None:
+                self._vecs = np.zeros((self.maxsize, vec.shape[0]), dtype=np.float32)
+            self._vecs[self._next] = vec
+            self._payloads[self._next] = payload
+            self._stamps[self._next] = time.monotonic()
+            self._next = (self._next + 1) % self.maxsize
+            self._size = min(self._size + 1, self.maxsize)
+
+    def __len__(self):
+        return self._size
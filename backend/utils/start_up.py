@@ -3,14 +3,9 @@ Optimized Startup Hook - Pre-initialize ALL heavy components
 Runs ONCE when Flask server starts
 """
 
-import os
-from dotenv import load_dotenv
 from utils.rag_service import get_rag_service
-
 from routes.agents.medical_agent_with_toolcall import get_medical_agent_tool_calling
 
-load_dotenv()
-
 
 def initialize_rag_components():
     """
@@ -20,6 +15,7 @@ def initialize_rag_components():
     - BM25 corpus (24k documents)
     - Reranker model
     - LLM client
+    - One warmup retrieval (embed + search + rerank)
     - Agent instance
 
     This runs ONCE when server starts, not per-request.
@@ -49,10 +45,15 @@ def initialize_rag_components():
         print("\n5. Loading LLM Client...")
         _ = rag.llm  # Triggers LLM client setup
 
+        print("\n6. Warming up retrieval pipeline...")
+        # First inference pays one-off costs (CUDA kernels, tokenizer caches,
+        # Pinecone connection); run one query now instead of on a user request
+        rag.retrieve_context("warmup", top_k=1, search_type="hybrid")
+
         # ==========================================
         # 2. Pre-load Agent (CRITICAL for speed!)
         # ==========================================
-        print("\n6. Pre-loading Medical Agent...")
+        print("\n7. Pre-loading Medical Agent...")
         agent = get_medical_agent_tool_calling(model_name="models/gemini-2.5-flash")
 
         print("\n" + "=" * 60)